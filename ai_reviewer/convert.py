@@ -1,35 +1,30 @@
-import os
-import hashlib
-import requests
 import json
+from ai_scientist.doc_store import get_document_store
+from ai_scientist.downloader import download_pdf
+from .omniparse import get_omniparse_client
 
 
 
-def download_pdf(url):
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    pdf_path = f"pdfs/{url_hash}.pdf"
+# Bump when the omniparse server (or its options) changes so stored documents are re-parsed.
+OMNIPARSE_VERSION = "1"
 
-    if os.path.exists(pdf_path):
-        print("PDF already downloaded.")
-        return pdf_path
-    
-    os.makedirs("pdfs", exist_ok=True)
 
-    response = requests.get(url)
-    with open(pdf_path, "wb") as f:
-        f.write(response.content)
-    return pdf_path
+def parse_pdf(pdf_path):
+    # 같은 PDF(내용 기준)는 한 번만 파싱하고 문서 저장소에서 재사용
+    return get_document_store().get_or_parse(
+        pdf_path, "omniparse", OMNIPARSE_VERSION, parse_pdf_with_omniparse
+    )
 
 
-def parse_pdf(pdf_path):
-    # curl -X POST -F "file=@2401.01854.pdf" http://localhost:8000/parse_document/pdf 
-    url = "http://localhost:8000/parse_document/pdf"
-    files = {"file": open(pdf_path, "rb")}
-    response = requests.post(url, files=files, timeout=240)
-    output_json = response.json()
-    # text = response.json()["text"]
-    # images = response.json()["images"]
+async def aparse_pdf(pdf_path):
+    # 이벤트 루프를 막지 않는 비동기 버전 (디스코드 봇용)
+    return await get_document_store().aget_or_parse(
+        pdf_path, "omniparse", OMNIPARSE_VERSION, get_omniparse_client().aparse_pdf
+    )
+
 
+def parse_pdf_with_omniparse(pdf_path):
+    # omniparse 응답 형식:
     # {
     #   "text": "Hello, world!", 
     #   "images": [
@@ -40,11 +35,7 @@ def parse_pdf(pdf_path):
     #     }
     #   ]
     # }
-
-    # with open(f"test.json", "w") as f:
-    #     json.dump(output_json, f)
-
-    return output_json
+    return get_omniparse_client().parse_pdf(pdf_path)
 
 
 if __name__ == "__main__":
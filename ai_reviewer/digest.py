@@ -0,0 +1,131 @@
+import contextvars
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ai_scientist.llm import get_response_from_llm
+
+# 리뷰 프롬프트에 넣을 수 있는 논문 길이 (문자 수)
+MAX_PAPER_CHARS = 40000
+# 요약 단계(map)에 쓰는 저렴한 모델과 청크 크기
+DIGEST_MODEL = "gpt-4.1-mini"
+CHUNK_CHARS = 16000
+# 청크 수 상한: 아주 긴 논문은 청크를 키워서 호출 수(=비용, 지연)를 고정
+MAX_CHUNKS = 16
+DIGEST_CONCURRENCY = 8
+
+DIGEST_SYSTEM_PROMPT = "You condense parts of research papers for a reviewer who cannot see the original."
+
+DIGEST_PROMPT = """Below is part {index}/{total} of a research paper.
+Condense it to at most {budget} characters, in the paper's language.
+- Keep every section heading, in order.
+- Keep the title, authors and abstract verbatim if they appear.
+- Keep key definitions, equations (as LaTeX), hyperparameters and all reported numbers.
+- Keep figure/table ids and captions such as [S3.F1] or "Table 2".
+Output only the condensed text.
+
+===Part {index}/{total}===
+{chunk}"""
+
+
+def split_sections(text):
+    """Split markdown text before each heading line."""
+    parts = re.split(r"\n(?=#{1,6} )", text)
+    return [p for p in parts if p.strip()]
+
+
+def split_long(text, size):
+    # 문단 경계에서 자르고, 문단 하나가 너무 길면 그냥 자름
+    pieces, current = [], ""
+    for para in text.split("\n\n"):
+        para += "\n\n"
+        if current and len(current) + len(para) > size:
+            pieces.append(current)
+            current = ""
+        while len(para) > size:
+            pieces.append(para[:size])
+            para = para[size:]
+        current += para
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def pack_chunks(text, chunk_chars):
+    chunks, current = [], ""
+    for section in split_sections(text):
+        for piece in split_long(section, chunk_chars):
+            if current and len(current) + len(piece) > chunk_chars:
+                chunks.append(current)
+                current = ""
+            current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_paper(text, chunk_chars=CHUNK_CHARS):
+    """
+    Pack whole sections into at most MAX_CHUNKS chunks of at most `chunk_chars`
+    characters, growing `chunk_chars` until the whole paper fits.
+    """
+    chunk_chars = max(chunk_chars, -(-len(text) // MAX_CHUNKS))
+    chunks = pack_chunks(text, chunk_chars)
+    # 섹션 단위로 채우면 청크가 덜 찰 수 있으므로, 넘치면 청크를 키워서 다시 나눔 (잘라 버리지 않음)
+    while len(chunks) > MAX_CHUNKS:
+        chunk_chars = chunk_chars * 5 // 4
+        chunks = pack_chunks(text, chunk_chars)
+    return chunks
+
+
+def summarize_chunk(client, model, chunk, index, total, budget):
+    summary, _ = get_response_from_llm(
+        DIGEST_PROMPT.format(index=index, total=total, budget=budget, chunk=chunk),
+        client=client,
+        model=model,
+        system_message=DIGEST_SYSTEM_PROMPT,
+        temperature=0,
+    )
+    return summary[:budget]
+
+
+def make_paper_digest(client, text, max_chars=MAX_PAPER_CHARS, model=DIGEST_MODEL):
+    """
+    Return `text` if it fits in `max_chars`, otherwise a digest of at most `max_chars`:
+    the paper is split along its sections and every chunk is condensed concurrently
+    (map), then the summaries are concatenated in order (reduce).
+    Chunks that fit their budget are kept verbatim.
+    """
+    if len(text) <= max_chars:
+        return text
+
+    start = time.perf_counter()
+    chunks = chunk_paper(text)
+    budget = max_chars // len(chunks) - 2
+    with ThreadPoolExecutor(max_workers=min(len(chunks), DIGEST_CONCURRENCY)) as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                summarize_chunk, client, model, chunk, i + 1, len(chunks), budget,
+            )
+            if len(chunk) > budget
+            else None
+            for i, chunk in enumerate(chunks)
+        ]
+        summaries = []
+        for chunk, future in zip(chunks, futures):
+            if future is None:
+                summaries.append(chunk)
+                continue
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                # 요약에 실패한 청크는 앞부분만 남김
+                print(f"Failed to summarize chunk: {e}")
+                summaries.append(chunk[:budget])
+
+    digest = "\n\n".join(summaries)
+    print(
+        f"Paper digest: {len(text)} -> {len(digest)} chars in {len(chunks)} chunks "
+        f"({time.perf_counter() - start:0.1f}s)"
+    )
+    return digest
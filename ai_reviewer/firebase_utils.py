@@ -4,9 +4,17 @@ import firebase_admin
 from firebase_admin import firestore, storage
 from firebase_admin import credentials
 import os, io
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import base64
 from PIL import Image
 import json
+from ai_scientist.rate_limit import get_backoff_delay
+from ai_reviewer.render import prerender
+from ai_reviewer.search_index import get_search_index
+from ai_reviewer.paper_key import canonical_paper_key, legacy_urls
+from collections import OrderedDict
 
 
 class PaperStore(BaseModel):
@@ -20,9 +28,82 @@ class PaperStore(BaseModel):
     review: str = ""
     tldr: str = ""
     image_files: list[str] = []
+    # add_paper 시점에 미리 만들어 두는 리뷰 페이지 HTML과 목록 카드 (ai_reviewer.render)
+    rendered_html: str = ""
+    card: dict = {}
+    # 같은 논문의 다른 URL(abs/pdf/버전 등)을 묶는 키 (ai_reviewer.paper_key)
+    paper_key: str = ""
+
+class PaperCard(BaseModel):
+    """Index page projection of a PaperStore."""
+    id: str
+    title: str
+    tldr: str = ""
+    review_time: datetime
+
+
+# 목록 페이지에서 읽는 필드 (card가 없는 backfill 이전 문서는 title/tldr을 따로 읽음)
+CARD_FIELDS = ["card", "review_time"]
+CARD_FALLBACK_FIELDS = ["title", "tldr"]
+PREFETCH_TTL = 30
+
+# get_by_url 결과를 기억할 paper_key 수
+PAPER_KEY_CACHE_SIZE = 512
+
+# 이미지 업로드 동시 실행 수와 재시도 횟수, Firestore/Storage batch 최대 크기
+UPLOAD_CONCURRENCY = 8
+UPLOAD_RETRIES = 3
+FIRESTORE_BATCH_SIZE = 500
+STORAGE_BATCH_SIZE = 100
+# 서명 URL 유효 시간, 만료 전 여유 시간(이 시간 이전에 새로 서명), 캐시 최대 항목 수
+SIGNED_URL_TTL = 3600
+SIGNED_URL_MARGIN = 300
+MAX_SIGNED_URLS = 10000
+
+
+def encode_cursor(review_time: datetime, paper_id: str) -> str:
+    raw = f"{review_time.isoformat()}|{paper_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    review_time, paper_id = raw.split("|", 1)
+    return datetime.fromisoformat(review_time), paper_id
+
 
 class FirebaseManager:
-    def __init__(self):
+    def __init__(self, db=None, bucket=None, search_index=None):
+        """
+        db / bucket: Firestore client and Storage bucket to use instead of the
+        credentials-based app (e.g. in-memory fakes). The Firestore emulator works
+        without them by setting FIRESTORE_EMULATOR_HOST.
+        search_index: local full-text index kept in step with add/delete
+        (default: ai_reviewer.search_index.get_search_index()).
+        """
+        self.search_index = search_index or get_search_index()
+        # (paper_id, image_name) -> (signed url, reuse until)
+        self._signed_urls = {}
+        self._signed_urls_lock = threading.Lock()
+        # 다음 목록 페이지 미리 읽기: (cursor, limit, search_query) -> (Future, 만료 시각)
+        self._prefetched = {}
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=2)
+
+        # paper_key -> (paper_id, PaperStore), LRU
+        self._papers_by_key = OrderedDict()
+        self._papers_by_key_lock = threading.Lock()
+
+        # add_paper / delete_review 후 호출되는 콜백 (웹 앱의 캐시 무효화 등)
+        self._change_listeners = []
+
+        if db is not None and bucket is not None:
+            self.app = None
+            self.db = db
+            self.collection = self.db.collection("papers")
+            self.storage = bucket
+            return
+
         project_id = os.environ["FIREBASE_PROJECT_ID"]
 
         app_options = {
@@ -36,12 +117,98 @@ class FirebaseManager:
         self.storage = storage.bucket(app=self.app)
 
 
-    def paginate(self, limit: int = 20, last_doc_id: str = None, search_query: str = None) -> list[PaperStore]:
+    def _ordered_query(self, search_query: str = None):
         if search_query:
             query = self.collection.where("title", ">=", search_query).where("title", "<=", search_query + "\uf8ff") \
                 .order_by("review_time", direction=firestore.Query.DESCENDING) 
         else:
             query = self.collection.order_by("review_time", direction=firestore.Query.DESCENDING) 
+        # review_time이 같은 문서 사이의 순서를 고정해서 커서가 (review_time, id)만으로 결정되게 함
+        return query.order_by(firestore.FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+
+    def _start_after_cursor(self, query, cursor: str):
+        review_time, paper_id = decode_cursor(cursor)
+        return query.start_after({
+            "review_time": review_time,
+            firestore.FieldPath.document_id(): self.collection.document(paper_id),
+        })
+
+    def paginate_cards(self, limit: int = 20, cursor: str = None, search_query: str = None):
+        """
+        One index page: (cards, next_cursor). Only the card fields are read, the cursor
+        encodes (review_time, id) so no extra read is needed, and the next page is
+        prefetched in the background. next_cursor is None on the last page.
+        An invalid cursor (e.g. an old ?after=<doc id> link) gives the first page.
+        """
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                # base64 / UTF-8 / ISO 형식 오류는 모두 ValueError
+                print(f"Invalid cursor {cursor!r}, returning the first page")
+                cursor = None
+        key = (cursor, limit, search_query)
+        with self._prefetch_lock:
+            prefetched = self._prefetched.pop(key, None)
+        if prefetched is not None and prefetched[1] > time.time():
+            try:
+                cards, next_cursor = prefetched[0].result()
+            except Exception as e:
+                print(f"Prefetch failed: {e}")
+                cards, next_cursor = self._fetch_cards(limit, cursor, search_query)
+        else:
+            cards, next_cursor = self._fetch_cards(limit, cursor, search_query)
+
+        if next_cursor is not None:
+            next_key = (next_cursor, limit, search_query)
+            with self._prefetch_lock:
+                now = time.time()
+                self._prefetched = {k: v for k, v in self._prefetched.items() if v[1] > now}
+                if next_key not in self._prefetched:
+                    future = self._prefetch_executor.submit(self._fetch_cards, limit, next_cursor, search_query)
+                    self._prefetched[next_key] = (future, now + PREFETCH_TTL)
+        return cards, next_cursor
+
+    def _fetch_cards(self, limit: int, cursor: str = None, search_query: str = None):
+        query = self._ordered_query(search_query).select(CARD_FIELDS)
+        if cursor:
+            query = self._start_after_cursor(query, cursor)
+        # 한 개 더 읽어서 다음 페이지가 있는지 확인
+        docs = query.limit(limit + 1).get()
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+
+        data = {doc.id: doc.to_dict() or {} for doc in docs}
+        missing = [doc.reference for doc in docs if not data[doc.id].get("card")]
+        if missing:
+            for doc in self.db.get_all(missing, field_paths=CARD_FALLBACK_FIELDS):
+                data[doc.id]["card"] = doc.to_dict() or {}
+
+        cards = []
+        for doc in docs:
+            d = data[doc.id]
+            if "review_time" not in d:
+                continue
+            cards.append(PaperCard(id=doc.id, review_time=d["review_time"], **d["card"]))
+
+        next_cursor = encode_cursor(cards[-1].review_time, cards[-1].id) if has_more and cards else None
+        return cards, next_cursor
+
+    def search_cards(self, search_query: str, limit: int = 20, cursor: str = None):
+        """
+        Full-text search (BM25) over title, authors, abstract, TL;DR and review:
+        (cards, next_cursor) like paginate_cards, the cursor being the result offset.
+        Only the local index is read; keep it current with
+        search_index.start_background_sync(manager) in the serving process.
+        """
+        offset = int(cursor) if cursor and cursor.isdigit() else 0
+        results = self.search_index.search(search_query, limit=limit + 1, offset=offset)
+        next_cursor = str(offset + limit) if len(results) > limit else None
+        return [PaperCard(**result) for result in results[:limit]], next_cursor
+
+    def paginate(self, limit: int = 20, last_doc_id: str = None, search_query: str = None) -> list[PaperStore]:
+        """Full documents; prefer paginate_cards for listing."""
+        query = self._ordered_query(search_query)
 
         if last_doc_id:
             last_doc = self.collection.document(last_doc_id).get()
@@ -58,14 +225,38 @@ class FirebaseManager:
         return outputs
                 
     def get_by_url(self, url: str) -> list:
-        docs = self.collection.where("url", "==", url).get()
+        """
+        (paper_id, PaperStore) of the paper behind `url` or (None, None). Links to the same
+        paper (arXiv abs/pdf/html and versions, OpenReview forum/pdf, DOI) share a
+        paper_key; found papers are kept in an in-process LRU.
+        """
+        paper_key = canonical_paper_key(url)
+        with self._papers_by_key_lock:
+            cached = self._papers_by_key.get(paper_key)
+            if cached is not None:
+                self._papers_by_key.move_to_end(paper_key)
+                return cached
+
+        docs = self.collection.where("paper_key", "==", paper_key).limit(1).get()
+        if len(docs) == 0:
+            # paper_key backfill 전에 저장된 논문
+            docs = self.collection.where("url", "in", legacy_urls(url)).limit(1).get()
         if len(docs) == 0:
             return None, None
         paper = docs[0].to_dict()
         if "id" not in paper:
             paper["id"] = docs[0].id
-            
-        return docs[0].id, PaperStore(**paper)
+
+        found = docs[0].id, PaperStore(**paper)
+        self._cache_paper_key(paper_key, found)
+        return found
+
+    def _cache_paper_key(self, paper_key, found):
+        with self._papers_by_key_lock:
+            self._papers_by_key[paper_key] = found
+            self._papers_by_key.move_to_end(paper_key)
+            while len(self._papers_by_key) > PAPER_KEY_CACHE_SIZE:
+                self._papers_by_key.popitem(last=False)
     
     def get_by_id(self, paper_id: str):
         doc = self.collection.document(paper_id).get()
@@ -74,36 +265,182 @@ class FirebaseManager:
             return PaperStore(**item)
         return None
 
-    def add_paper(self, paper: PaperStore):
-        _, ref = self.collection.add(paper.model_dump())
-        print(f"Added paper {ref.id} to Firestore: {paper.title}")
-        return ref.id
-    
+    def add_change_listener(self, listener):
+        """listener(paper_id) runs after a paper is added or deleted (paper_id is None for bulk adds)."""
+        self._change_listeners.append(listener)
+
+    def _notify_change(self, paper_id):
+        for listener in self._change_listeners:
+            listener(paper_id)
+
+    def _update_search_index(self, update, *args):
+        # 인덱스는 Firestore에서 다시 만들 수 있으므로 실패해도 저장/삭제는 계속
+        try:
+            update(*args)
+        except Exception as e:
+            print(f"Failed to update search index: {e}")
+
+    def new_paper_id(self):
+        """Allocate a document id without writing, so images can be uploaded before add_paper."""
+        return self.collection.document().id
+
+    def add_paper(self, paper: PaperStore, paper_id: str = None, images: list[dict] = None):
+        """
+        images: uploaded (in parallel) before the document is committed, so the paper
+        never shows up without its figures.
+        """
+        if images:
+            paper_id = paper_id or self.new_paper_id()
+            self.upload_image(paper_id, images)
+        if not paper.rendered_html:
+            prerender(paper)
+        if not paper.paper_key:
+            paper.paper_key = canonical_paper_key(paper.url)
+        if paper_id is None:
+            _, ref = self.collection.add(paper.model_dump())
+            paper_id = ref.id
+        else:
+            self.collection.document(paper_id).set(paper.model_dump())
+        print(f"Added paper {paper_id} to Firestore: {paper.title}")
+        self._cache_paper_key(paper.paper_key, (paper_id, paper))
+        self._update_search_index(self.search_index.add, paper_id, paper)
+        self._notify_change(paper_id)
+        return paper_id
+
+    def backfill(self, fields, update_fn, force=False) -> int:
+        """
+        Update existing papers in WriteBatches of FIRESTORE_BATCH_SIZE.
+        fields: the fields to read (None for whole documents).
+        update_fn(data, force) returns the fields to update, or None to skip the paper.
+        """
+        query = self.collection if fields is None else self.collection.select(fields)
+        batch, pending, updated = self.db.batch(), 0, 0
+        for doc in query.stream():
+            updates = update_fn(doc.to_dict() or {}, force)
+            if not updates:
+                continue
+            batch.update(doc.reference, updates)
+            pending += 1
+            if pending == FIRESTORE_BATCH_SIZE:
+                batch.commit()
+                updated += pending
+                batch, pending = self.db.batch(), 0
+        if pending:
+            batch.commit()
+            updated += pending
+        return updated
+
+    def add_papers(self, papers: list[PaperStore]) -> list[str]:
+        """Add many papers (e.g. a backfill) with WriteBatch commits of up to 500 writes."""
+        paper_ids = []
+        for start in range(0, len(papers), FIRESTORE_BATCH_SIZE):
+            batch = self.db.batch()
+            for paper in papers[start:start + FIRESTORE_BATCH_SIZE]:
+                if not paper.rendered_html:
+                    prerender(paper)
+                if not paper.paper_key:
+                    paper.paper_key = canonical_paper_key(paper.url)
+                ref = self.collection.document()
+                batch.set(ref, paper.model_dump())
+                paper_ids.append(ref.id)
+            batch.commit()
+        print(f"Added {len(paper_ids)} papers to Firestore.")
+        self._update_search_index(
+            self.search_index.add_many,
+            [(paper_id, paper.model_dump()) for paper_id, paper in zip(paper_ids, papers)],
+        )
+        self._notify_change(None)
+        return paper_ids
+
     def upload_image(self, paper_id: str, base64_images: list[dict]):
         """
         base64_images: [{"image_name": "image1.png", "image": "base64-encoded-image-data"}]
+        or raw bytes: [{"image_name": "image1.png", "data": b"..."}]
         """
 
-        for image in base64_images:
+        if not base64_images:
+            return
+        with ThreadPoolExecutor(max_workers=min(len(base64_images), UPLOAD_CONCURRENCY)) as executor:
+            futures = [executor.submit(self._upload_one, paper_id, image) for image in base64_images]
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            raise errors[0]
+
+    def _upload_one(self, paper_id: str, image: dict):
+        if "data" in image:
+            image_data = image["data"]
+        else:
             image_data = base64.b64decode(image["image"])
-            image_name = image["image_name"]
-            ext = image_name.split(".")[-1].lower()
-            blob = self.storage.blob(f"images/{paper_id}/{image_name}")
-            blob.upload_from_string(image_data, content_type=f"image/{ext}")
+        image_name = image["image_name"]
+        ext = image_name.split(".")[-1].lower()
+        blob = self.storage.blob(f"images/{paper_id}/{image_name}")
+        for attempt in range(UPLOAD_RETRIES + 1):
+            try:
+                blob.upload_from_string(image_data, content_type=f"image/{ext}")
+                return
+            except Exception as e:
+                if attempt == UPLOAD_RETRIES:
+                    raise
+                delay = get_backoff_delay(attempt, e)
+                print(f"Retrying upload of {image_name} in {delay:0.1f} seconds after {type(e).__name__}")
+                time.sleep(delay)
 
     def get_image_download_url(self, paper_id: str, image_name: str):
-        blob = self.storage.blob(f"images/{paper_id}/{image_name}")
-        return blob.generate_signed_url(expiration=int(datetime.now().timestamp() + 3600))
+        return self.get_image_download_urls(paper_id, [image_name])[image_name]
+
+    def get_image_download_urls(self, paper_id: str, image_names: list[str]) -> dict:
+        """
+        Signed URLs for several images of one paper, {image_name: url}.
+        URLs are cached until SIGNED_URL_MARGIN seconds before their signature expires.
+        """
+        now = time.time()
+        urls = {}
+        with self._signed_urls_lock:
+            for image_name in image_names:
+                cached = self._signed_urls.get((paper_id, image_name))
+                if cached is not None and cached[1] > now:
+                    urls[image_name] = cached[0]
+
+        missing = [name for name in dict.fromkeys(image_names) if name not in urls]
+        if not missing:
+            return urls
+        expiration = int(now + SIGNED_URL_TTL)
+        for image_name in missing:
+            blob = self.storage.blob(f"images/{paper_id}/{image_name}")
+            urls[image_name] = blob.generate_signed_url(expiration=expiration)
+
+        with self._signed_urls_lock:
+            if len(self._signed_urls) > MAX_SIGNED_URLS:
+                self._signed_urls = {k: v for k, v in self._signed_urls.items() if v[1] > now}
+            for image_name in missing:
+                self._signed_urls[(paper_id, image_name)] = (
+                    urls[image_name],
+                    expiration - SIGNED_URL_MARGIN,
+                )
+        return urls
 
     def delete_review(self, paper_id: str):
         self.collection.document(paper_id).delete()
         print(f"Deleted paper {paper_id} from Firestore.")
+        with self._signed_urls_lock:
+            self._signed_urls = {k: v for k, v in self._signed_urls.items() if k[0] != paper_id}
+        with self._papers_by_key_lock:
+            for paper_key in [k for k, v in self._papers_by_key.items() if v[0] == paper_id]:
+                del self._papers_by_key[paper_key]
 
         # delete images from firebase storage
-        blobs = self.storage.list_blobs(prefix=f"images/{paper_id}")
-        for blob in blobs:
-            blob.delete()
-            print(f"Deleted image {blob.name} from Firebase Storage.")
+        self.delete_images(paper_id)
+        self._update_search_index(self.search_index.remove, paper_id)
+        self._notify_change(paper_id)
+
+    def delete_images(self, paper_id: str):
+        blobs = list(self.storage.list_blobs(prefix=f"images/{paper_id}/"))
+        # Storage batch 요청은 최대 100개씩
+        for start in range(0, len(blobs), STORAGE_BATCH_SIZE):
+            with self.storage.client.batch():
+                for blob in blobs[start:start + STORAGE_BATCH_SIZE]:
+                    blob.delete()
+        print(f"Deleted {len(blobs)} images of {paper_id} from Firebase Storage.")
 
 if __name__ == "__main__":
     manager = FirebaseManager()
@@ -0,0 +1,163 @@
+import re
+import time
+import lxml.html
+
+# Compact markdown from arXiv (LaTeXML) HTML papers: section headings, paragraphs,
+# equations as LaTeX (from the MathML alttext), lists, tables and figure captions
+# tagged with their ids so reviews can reference them.
+
+HEADING_LEVELS = {
+    "ltx_title_document": 1,
+    "ltx_title_section": 2,
+    "ltx_title_appendix": 2,
+    "ltx_title_subsection": 3,
+    "ltx_title_subsubsection": 4,
+    "ltx_title_paragraph": 5,
+    "ltx_title_abstract": 2,
+}
+# Elements that only add noise for the reviewer.
+SKIPPED_CLASSES = {
+    "ltx_note_mark",
+    "ltx_tag_item",
+    "ltx_tag_note",
+    "ltx_page_footer",
+    "ltx_page_navbar",
+    "ltx_dates",
+    "ltx_ERROR",
+}
+
+
+def classes(el):
+    return set((el.get("class") or "").split())
+
+
+def collapse(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def render_math(el):
+    tex = collapse(el.get("alttext") or el.text_content())
+    if el.get("display") == "block":
+        return f"\n$$\n{tex}\n$$\n"
+    return f"${tex}$"
+
+
+def render_inline(el):
+    """Text of an inline element and its children (without el.tail)."""
+    parts = [el.text or ""]
+    for child in el:
+        if not isinstance(child.tag, str):
+            # Comments and processing instructions.
+            parts.append(child.tail or "")
+            continue
+        cls = classes(child)
+        if cls & SKIPPED_CLASSES:
+            pass
+        elif child.tag == "math":
+            parts.append(render_math(child))
+        elif "ltx_note" in cls:
+            parts.append(f" ({collapse(render_inline(child))})")
+        elif child.tag == "br":
+            parts.append("\n")
+        elif child.tag in ("img", "svg"):
+            pass
+        else:
+            parts.append(render_inline(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def render_table(table):
+    rows = []
+    for tr in table.iter("tr"):
+        cells = [collapse(render_inline(cell)).replace("|", "\\|") for cell in tr if cell.tag in ("td", "th")]
+        if cells:
+            rows.append(cells)
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    lines = ["| " + " | ".join(rows[0]) + " |", "|" + " --- |" * width]
+    lines += ["| " + " | ".join(row) + " |" for row in rows[1:]]
+    return "\n".join(lines)
+
+
+def render_equation(table):
+    # Numbered equations are laid out as tables: the math cells plus an "(n)" cell.
+    equations = [render_math(m).strip() for m in table.iter("math")]
+    number = table.xpath('.//*[contains(@class, "ltx_eqn_eqno")]')
+    tag = f" {collapse(number[0].text_content())}" if number else ""
+    tex = " \\\\ ".join(e.strip("$\n") for e in equations)
+    return f"$$\n{tex}\n$${tag}"
+
+
+def render_figure(fig):
+    caption = fig.xpath('.//figcaption')
+    caption = collapse(render_inline(caption[0])) if caption else ""
+    fig_id = fig.get("id")
+    parts = [f"**[{fig_id}]** {caption}" if fig_id else caption]
+    for table in fig.xpath('.//table[contains(@class, "ltx_tabular")]'):
+        parts.append(render_table(table))
+    return "\n\n".join(p for p in parts if p)
+
+
+def render_blocks(el, blocks, include_bibliography):
+    for child in el:
+        if not isinstance(child.tag, str):
+            continue
+        cls = classes(child)
+        if cls & SKIPPED_CLASSES:
+            continue
+        if "ltx_bibliography" in cls and not include_bibliography:
+            continue
+
+        level = next((HEADING_LEVELS[c] for c in cls if c in HEADING_LEVELS), None)
+        if level is not None:
+            blocks.append("#" * level + " " + collapse(render_inline(child)))
+        elif "ltx_authors" in cls:
+            blocks.append(collapse(render_inline(child)))
+        elif child.tag == "figure" or "ltx_figure" in cls or "ltx_table" in cls:
+            blocks.append(render_figure(child))
+        elif child.tag == "table" and ("ltx_equation" in cls or "ltx_equationgroup" in cls):
+            blocks.append(render_equation(child))
+        elif child.tag == "table":
+            blocks.append(render_table(child))
+        elif child.tag in ("ul", "ol"):
+            for i, item in enumerate(child.xpath("./li"), 1):
+                bullet = f"{i}." if child.tag == "ol" else "-"
+                blocks.append(f"{bullet} {collapse(render_inline(item))}")
+        elif child.tag == "p" or child.tag.startswith("h") and child.tag[1:].isdigit():
+            text = render_inline(child)
+            # Keep display math on its own lines, collapse the rest.
+            text = "\n".join(collapse(line) if not line.startswith("$$") else line for line in text.split("\n"))
+            text = re.sub(r"\n{2,}", "\n", text).strip()
+            if text:
+                blocks.append(text)
+        else:
+            render_blocks(child, blocks, include_bibliography)
+    return blocks
+
+
+def html_to_markdown(article, include_bibliography=False):
+    """Markdown for a LaTeXML `<article class="ltx_document">` element."""
+    blocks = render_blocks(article, [], include_bibliography)
+    return "\n\n".join(b for b in blocks if b)
+
+
+def extract_arxiv_html(html, include_bibliography=False):
+    """
+    Parse an arXiv HTML page. Returns (article element, markdown), or (None, None)
+    when the page has no LaTeXML article. Prints the compression ratio and parse time.
+    """
+    start = time.perf_counter()
+    root = lxml.html.fromstring(html)
+    article = root.xpath('//article[contains(concat(" ", @class, " "), " ltx_document ")]')
+    if not article:
+        return None, None
+    article = article[0]
+    markdown = html_to_markdown(article, include_bibliography)
+    print(
+        f"HTML to markdown: {len(html)} -> {len(markdown)} chars "
+        f"({len(html) / max(len(markdown), 1):0.1f}x) in {time.perf_counter() - start:0.2f}s"
+    )
+    return article, markdown
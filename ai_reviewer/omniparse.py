@@ -0,0 +1,176 @@
+import asyncio
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from ai_scientist.rate_limit import get_backoff_delay
+
+# curl -X POST -F "file=@2401.01854.pdf" http://localhost:8000/parse_document/pdf
+OMNIPARSE_URL = os.environ.get("OMNIPARSE_URL", "http://localhost:8000")
+PARSE_PDF_PATH = "/parse_document/pdf"
+# omniparse is a FastAPI app, so /docs answers whenever the server is up.
+HEALTH_PATH = "/docs"
+
+
+class OmniparseError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"omniparse returned {status_code}: {message}")
+        self.status_code = status_code
+
+
+class OmniparseClient:
+    """
+    Client for the omniparse parse_document service with a keep-alive connection pool.
+    At most `max_in_flight` documents are parsed at once; further calls queue until a
+    slot frees up. Connection errors (including connect timeouts), 429 and 5xx responses
+    are retried; a parse that runs past `timeout` is not, so one slow PDF holds a slot
+    for at most `timeout` seconds.
+    """
+
+    def __init__(self, base_url=OMNIPARSE_URL, max_in_flight=4, timeout=240, max_retries=2, connect_timeout=10):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.metrics = {"requests": 0, "retries": 0, "failures": 0, "queued": 0, "seconds": 0.0}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+
+        # aiohttp sessions and asyncio semaphores are bound to one event loop.
+        self._async_sessions = {}
+        self._async_slots = {}
+
+    def _check(self, status_code, text):
+        if status_code >= 400:
+            raise OmniparseError(status_code, text[:500])
+
+    def _should_retry(self, error, attempt, transient_errors, final_errors=()):
+        if attempt == self.max_retries:
+            return False
+        if isinstance(error, OmniparseError):
+            return error.status_code >= 500 or error.status_code == 429
+        return isinstance(error, transient_errors) and not isinstance(error, final_errors)
+
+    def _record_retry(self, error, attempt):
+        delay = get_backoff_delay(attempt, error)
+        self.metrics["retries"] += 1
+        print(f"Retrying omniparse in {delay:0.1f} seconds after {type(error).__name__} (attempt {attempt + 1})")
+        return delay
+
+    def parse_pdf(self, pdf_path):
+        """Parse a PDF; returns omniparse's JSON ({"text": ..., "images": [...]})."""
+        self.metrics["queued"] += 1
+        with self.slots:
+            self.metrics["queued"] -= 1
+            for attempt in range(self.max_retries + 1):
+                self.metrics["requests"] += 1
+                start = time.perf_counter()
+                try:
+                    with open(pdf_path, "rb") as f:
+                        response = self.session.post(
+                            self.base_url + PARSE_PDF_PATH,
+                            files={"file": (os.path.basename(pdf_path), f, "application/pdf")},
+                            timeout=(self.connect_timeout, self.timeout),
+                        )
+                    self._check(response.status_code, response.text)
+                    return response.json()
+                except Exception as e:
+                    # ConnectTimeout은 ConnectionError라서 재시도, ReadTimeout(파싱이 오래 걸림)은 재시도 안 함
+                    if not self._should_retry(e, attempt, (requests.ConnectionError,)):
+                        self.metrics["failures"] += 1
+                        raise
+                    time.sleep(self._record_retry(e, attempt))
+                finally:
+                    self.metrics["seconds"] += time.perf_counter() - start
+
+    def health_check(self, timeout=5):
+        try:
+            return self.session.get(self.base_url + HEALTH_PATH, timeout=timeout).status_code < 500
+        except requests.RequestException:
+            return False
+
+    def _get_async_session(self):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+            )
+            self._async_sessions[loop] = session
+            self._async_slots[loop] = asyncio.Semaphore(self.max_in_flight)
+        return session, self._async_slots[loop]
+
+    async def aparse_pdf(self, pdf_path):
+        """Async version of parse_pdf; never blocks the event loop."""
+        import aiohttp
+
+        session, slots = self._get_async_session()
+        self.metrics["queued"] += 1
+        async with slots:
+            self.metrics["queued"] -= 1
+            data = await asyncio.to_thread(_read_file, pdf_path)
+            for attempt in range(self.max_retries + 1):
+                self.metrics["requests"] += 1
+                start = time.perf_counter()
+                form = aiohttp.FormData()
+                form.add_field(
+                    "file", data, filename=os.path.basename(pdf_path), content_type="application/pdf"
+                )
+                try:
+                    async with session.post(
+                        self.base_url + PARSE_PDF_PATH,
+                        data=form,
+                        timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+                    ) as response:
+                        self._check(response.status, await response.text())
+                        return await response.json(content_type=None)
+                except Exception as e:
+                    # 연결 오류만 재시도, 시간 초과(aiohttp의 ServerTimeoutError 포함)는 재시도 안 함
+                    if not self._should_retry(
+                        e, attempt, (aiohttp.ClientConnectionError,), (asyncio.TimeoutError,)
+                    ):
+                        self.metrics["failures"] += 1
+                        raise
+                    await asyncio.sleep(self._record_retry(e, attempt))
+                finally:
+                    self.metrics["seconds"] += time.perf_counter() - start
+
+    async def ahealth_check(self, timeout=5):
+        import aiohttp
+
+        session, _ = self._get_async_session()
+        try:
+            async with session.get(
+                self.base_url + HEALTH_PATH, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                return response.status < 500
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def aclose(self):
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+_client = None
+
+
+def get_omniparse_client():
+    global _client
+    if _client is None:
+        _client = OmniparseClient(max_in_flight=int(os.environ.get("OMNIPARSE_MAX_IN_FLIGHT", 4)))
+    return _client
@@ -0,0 +1,78 @@
+import re
+from urllib.parse import urlsplit, parse_qs, unquote
+
+# arXiv 버전 정책: False면 v1/v2/... 를 같은 논문으로 보고 기존 리뷰를 재사용
+ARXIV_KEEP_VERSION = False
+
+# 2401.01854, 2401.01854v2, hep-th/9901001v1
+ARXIV_ID = r"(?P<id>\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(?P<version>v\d+)?"
+ARXIV_URL = re.compile(
+    r"^(?:www\.|export\.)?arxiv\.org/(?:abs|pdf|html|format)/" + ARXIV_ID + r"(?:\.pdf)?/?$"
+)
+DOI = re.compile(r"(10\.\d{4,9}/[^\s?#]+)")
+OPENREVIEW_HOSTS = {"openreview.net", "www.openreview.net"}
+
+
+def arxiv_key(arxiv_id, version=None):
+    if ARXIV_KEEP_VERSION and version:
+        return f"arxiv:{arxiv_id}{version}"
+    return f"arxiv:{arxiv_id}"
+
+
+def canonical_paper_key(url):
+    """
+    One key per paper however it was linked:
+    "arxiv:<id>" (abs/pdf/html pages, any version unless ARXIV_KEEP_VERSION),
+    "openreview:<id>" (forum/pdf pages), "doi:<doi>", otherwise "url:<host/path?query>".
+    """
+    url = url.strip()
+    parts = urlsplit(url if "://" in url else "https://" + url)
+    host = parts.netloc.lower()
+    path = unquote(parts.path)
+
+    match = ARXIV_URL.match(host + path)
+    if match:
+        return arxiv_key(match.group("id"), match.group("version"))
+
+    if host in OPENREVIEW_HOSTS:
+        ids = parse_qs(parts.query).get("id")
+        if ids:
+            return f"openreview:{ids[0]}"
+
+    if host in ("doi.org", "dx.doi.org") or "/doi/" in path:
+        match = DOI.search(path)
+        if match:
+            # DOI는 대소문자를 구분하지 않음
+            return "doi:" + match.group(1).rstrip("/").lower()
+
+    query = f"?{parts.query}" if parts.query else ""
+    return f"url:{host.removeprefix('www.')}{path.rstrip('/')}{query}"
+
+
+def legacy_urls(url):
+    """URLs a paper stored before paper_key existed may have been saved under (review_pdf stored abs links as pdf)."""
+    urls = [url]
+    if url.startswith("https://arxiv.org/abs/"):
+        urls.append(url.replace("abs", "pdf"))
+    return urls
+
+
+def paper_key_update(data, force=False):
+    if not data.get("url") or (data.get("paper_key") and not force):
+        return None
+    return {"paper_key": canonical_paper_key(data["url"])}
+
+
+def backfill_paper_keys(manager, force=False):
+    """Store paper_key on existing papers that lack it (every paper with force=True)."""
+    updated = manager.backfill(["url", "paper_key"], paper_key_update, force=force)
+    print(f"Stored paper keys of {updated} papers.")
+    return updated
+
+
+if __name__ == "__main__":
+    # python -m ai_reviewer.paper_key [--force]
+    import sys
+    from ai_reviewer.firebase_utils import FirebaseManager
+
+    backfill_paper_keys(FirebaseManager(), force="--force" in sys.argv)
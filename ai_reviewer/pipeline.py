@@ -0,0 +1,62 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StageGraph:
+    """
+    Tiny DAG executor: every stage runs on a thread as soon as the stages it depends on
+    have finished, receiving their results as arguments. A failed stage fails every
+    stage that depends on it. Per-stage timings are kept in `timings`
+    ({name: {"start": s, "seconds": s}}, start relative to the graph's creation).
+
+        graph = StageGraph()
+        graph.add("fetch", fetch, url=url)
+        graph.add("review", review, deps=["fetch"])
+        graph.result("review")
+
+    Stages wait for their dependencies on their own thread, so keep the number of
+    stages at or below `max_workers`.
+    """
+
+    def __init__(self, max_workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = {}
+        self.timings = {}
+        self.created = time.perf_counter()
+
+    def add(self, name, fn, *args, deps=(), **kwargs):
+        dep_futures = [self.futures[d] for d in deps]
+
+        def run():
+            dep_results = [f.result() for f in dep_futures]
+            start = time.perf_counter()
+            try:
+                return fn(*dep_results, *args, **kwargs)
+            finally:
+                self.timings[name] = {
+                    "start": start - self.created,
+                    "seconds": time.perf_counter() - start,
+                }
+
+        # Stages keep the caller's command/pipeline labels.
+        self.futures[name] = self.executor.submit(contextvars.copy_context().run, run)
+        return self.futures[name]
+
+    def result(self, name):
+        return self.futures[name].result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def format_timings(self):
+        return ", ".join(
+            f"{name} {t['start']:0.1f}+{t['seconds']:0.1f}s"
+            for name, t in sorted(self.timings.items(), key=lambda item: item[1]["start"])
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
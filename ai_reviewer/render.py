@@ -0,0 +1,69 @@
+import markdown
+
+DOC_FORMAT = """
+- Authors: {authors}
+- URL: [{url}]({url})
+
+## TL;DR
+{tldr}
+
+## AI Review
+{markdown}
+""".strip()
+
+# 목록 카드에 보여줄 TL;DR 최대 길이
+CARD_TLDR_CHARS = 300
+
+
+def render_review_html(paper):
+    """Review page HTML of a PaperStore; image links keep their (unsigned) image names."""
+    content = DOC_FORMAT.format(
+        title=paper.title,
+        tldr=paper.tldr,
+        url=paper.url,
+        authors=paper.authors,
+        markdown=paper.review
+    )
+    # Markdown을 HTML로 변환
+    return markdown.markdown(
+        content.replace("\\n", "\n"),
+        extensions=['meta', 'fenced_code', 'tables']
+    )
+
+
+def make_card(paper):
+    """The fields the index page shows for a paper."""
+    tldr = paper.tldr
+    if len(tldr) > CARD_TLDR_CHARS:
+        tldr = tldr[:CARD_TLDR_CHARS].rstrip() + "…"
+    return {"title": paper.title, "tldr": tldr}
+
+
+def prerender(paper):
+    paper.rendered_html = render_review_html(paper)
+    paper.card = make_card(paper)
+    return paper
+
+
+def rendered_html_update(data, force=False):
+    from ai_reviewer.firebase_utils import PaperStore
+
+    if not data or (data.get("rendered_html") and not force):
+        return None
+    paper = prerender(PaperStore(**data))
+    return {"rendered_html": paper.rendered_html, "card": paper.card}
+
+
+def backfill_rendered_html(manager, force=False):
+    """Store rendered_html and card on existing papers that lack them (every paper with force=True)."""
+    updated = manager.backfill(None, rendered_html_update, force=force)
+    print(f"Pre-rendered {updated} papers.")
+    return updated
+
+
+if __name__ == "__main__":
+    # python -m ai_reviewer.render [--force]
+    import sys
+    from ai_reviewer.firebase_utils import FirebaseManager
+
+    backfill_rendered_html(FirebaseManager(), force="--force" in sys.argv)
@@ -3,11 +3,18 @@ from datetime import datetime
 import json
 from .convert import download_pdf, parse_pdf
 from .firebase_utils import FirebaseManager, PaperStore
-from bs4 import BeautifulSoup
-import requests
+from .html_extract import extract_arxiv_html
+from .digest import make_paper_digest
+from .pipeline import StageGraph
+import lxml.html
 import base64
+from concurrent.futures import ThreadPoolExecutor
 import markdownify
 from pprint import pprint
+from ai_scientist.llm_cache import get_llm_cache
+from ai_scientist.rate_limit import call_with_rate_limit
+from ai_scientist.instrumentation import record_call, track_pipeline
+from ai_scientist.downloader import get_session, check_size, CHUNK_SIZE
 
 
 class PaperInfoExtraction(BaseModel):
@@ -34,22 +41,45 @@ class MarkdownReview(BaseModel):
     limitations: str
     future_works: str
 
+def parse_completion(client, model, messages, response_format, max_tokens=4096):
+    # 같은 논문을 다시 리뷰하는 경우 캐시된 structured output을 재사용
+    cache = get_llm_cache()
+    if cache is not None:
+        cache_key = cache.make_key(
+            model, None, messages, None, response_format=response_format, max_tokens=max_tokens
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            record_call(model, cached=True)
+            return response_format.model_validate(cached)
+
+    response = call_with_rate_limit(
+        client.beta.chat.completions.parse,
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        response_format=response_format,
+    )
+    parsed = response.choices[0].message.parsed
+    if cache is not None:
+        cache.set(cache_key, parsed.model_dump())
+    return parsed
+
 def extract_paper_info(client, model, pdf_text: str):
     extract_prompt = f"""주어진 논문을 읽고 아래 항목을 추출해주세요: 제목, abstract, 저자, TLDR(한글로 작성해주세요).
     
 ===논문 내용===
 {pdf_text[:40000]}""".strip()
 
-    response = client.beta.chat.completions.parse(
+    return parse_completion(
+        client,
         # model=model,
         model="gpt-4o-mini",
         messages=[
             {"role": "user", "content": extract_prompt}
         ],
-        max_tokens=4096,
         response_format=PaperInfoExtraction,
     )
-    return response.choices[0].message.parsed
 
 
 REVIEW_FORMAT = """
@@ -78,15 +108,14 @@ def get_ai_review_from_arxiv_html(client, model, pdf_text: str, figures: list[di
     analysis_prompt += "\n각 섹션은 500단어 이상으로 상세하고 명확하게 작성해주시고, 논문의 내용을 정확히 반영해야 합니다. 설명에 도움이 되는 figure를 논문에서 찾아 첨부해주세요."
     analysis_prompt += f"\n===논문 내용==={pdf_text}"
     
-    response = client.beta.chat.completions.parse(
+    review = parse_completion(
+        client,
         model=model,
         messages=[
             {"role": "user", "content": analysis_prompt}
         ],
-        max_tokens=4096,
         response_format=ArxivHTMLPaperReview,
     )
-    review = response.choices[0].message.parsed
 
     in_depth_insights = review.in_depth_insights.content
     methodology = review.methodology.content
@@ -129,15 +158,14 @@ def gen_ai_review_from_markdown(client, model, pdf_text: str):
     analysis_prompt += "\n각 섹션은 500단어 이상으로 상세하고 명확하게 작성해주시고, 논문의 내용을 정확히 반영해야 합니다. 설명에 도움이 되는 이미지나 테이블이 존재한다면, 각 섹션에 추가해주세요 단, 존재하지 않는 placeholder를 넣어서는 안됩니다."
     analysis_prompt += f"\n===논문 내용==={pdf_text}"
     
-    response = client.beta.chat.completions.parse(
+    review = parse_completion(
+        client,
         model=model,
         messages=[
             {"role": "user", "content": analysis_prompt}
         ],
-        max_tokens=4096,
         response_format=MarkdownReview,
     )
-    review = response.choices[0].message.parsed
 
     in_depth_insights = review.in_depth_insights
     methodology = review.methodology
@@ -158,49 +186,169 @@ def gen_ai_review_from_markdown(client, model, pdf_text: str):
 
     return review
 
-def review_pdf(client, model: str, manager: FirebaseManager, pdf_url: str, upload=True):
+def fetch_paper(pdf_url):
+    # arXiv HTML이 있으면 HTML(이미지는 URL만), 없으면 PDF를 받아서 파싱
+    pdf_json = fetch_arxiv_html(pdf_url)
+    if pdf_json is not None:
+        print("HTML content Found")
+        return pdf_json, True
+    pdf_path = download_pdf(pdf_url)
+    return parse_pdf(pdf_path), False
 
-    if pdf_url.startswith("https://arxiv.org/abs/"):
-        pdf_url = pdf_url.replace("abs", "pdf")
 
-    pdf_json = check_html(pdf_url)
-    is_arxiv_html = pdf_json is not None
-    if pdf_json is None:
-        pdf_path = download_pdf(pdf_url)
-        pdf_json = parse_pdf(pdf_path)
-    else:
-        print("HTML content Found")
+def get_paper_images(fetched, encode_images):
+    pdf_json, is_arxiv_html = fetched
+    if is_arxiv_html:
+        return get_image_files(pdf_json["image_sources"], encode_images)
+    return pdf_json["images"]
 
-    pdf_text = pdf_json['text']
-    images = pdf_json['images']
-    
-    paper_info = extract_paper_info(client, model, pdf_text)
+
+def get_paper_review(fetched, paper_text, client, model):
+    pdf_json, is_arxiv_html = fetched
     if is_arxiv_html:
-        review = get_ai_review_from_arxiv_html(client, model, pdf_text, pdf_json.get('figures'))
-    else:
-        review = gen_ai_review_from_markdown(client, model, pdf_text)
-    
-    if upload:
-        paper = PaperStore(
-            title=paper_info.title,
-            abstract=paper_info.abstract,
-            authors=paper_info.authors,
-            tldr=paper_info.tldr,
-            markdown=pdf_text[:40000] if len(pdf_text) > 40000 else pdf_text,
-            review=review,
-            url=pdf_url,
-            review_time=datetime.now(),
-            image_files=[img['image_name'] for img in images]
+        return get_ai_review_from_arxiv_html(client, model, paper_text, pdf_json.get('figures'))
+    return gen_ai_review_from_markdown(client, model, paper_text)
+
+
+def store_paper(fetched, paper_info, review, images, manager, paper_id, pdf_url):
+    pdf_text = fetched[0]['text']
+    paper = PaperStore(
+        title=paper_info.title,
+        abstract=paper_info.abstract,
+        authors=paper_info.authors,
+        tldr=paper_info.tldr,
+        markdown=pdf_text[:40000] if len(pdf_text) > 40000 else pdf_text,
+        review=review,
+        url=pdf_url,
+        review_time=datetime.now(),
+        image_files=[img['image_name'] for img in images]
+    )
+    manager.add_paper(paper, paper_id=paper_id)
+    return paper
+
+
+@track_pipeline("ai_review")
+def review_pdf(client, model: str, manager: FirebaseManager, pdf_url: str, upload=True, map_reduce=True, timings=None):
+    """
+    map_reduce: condense papers longer than MAX_PAPER_CHARS section by section
+    (make_paper_digest) instead of truncating them.
+    timings: optional dict that receives the per-stage timings.
+
+    Stages run as a DAG: images are fetched (and uploaded under a pre-allocated paper id)
+    while paper info and the review are generated concurrently.
+    """
+
+    if pdf_url.startswith("https://arxiv.org/abs/"):
+        pdf_url = pdf_url.replace("abs", "pdf")
+
+    paper_id = manager.new_paper_id() if upload else None
+    with StageGraph() as graph:
+        graph.add("fetch", fetch_paper, pdf_url)
+        # 이미지는 바로 스토리지에 올리므로 base64 인코딩 생략
+        graph.add("images", get_paper_images, not upload, deps=["fetch"])
+        graph.add(
+            "digest",
+            lambda fetched: make_paper_digest(client, fetched[0]['text']) if map_reduce else fetched[0]['text'],
+            deps=["fetch"],
         )
-        paper_id = manager.add_paper(paper)
-        manager.upload_image(paper_id, images)
+        graph.add("info", lambda paper_text: extract_paper_info(client, model, paper_text), deps=["digest"])
+        graph.add("review", get_paper_review, client, model, deps=["fetch", "digest"])
+        if upload:
+            graph.add("upload_images", lambda images: manager.upload_image(paper_id, images), deps=["images"])
+            # 이미지가 모두 올라간 뒤에만 문서를 저장 (업로드 실패 시 이미지 없는 논문이 남지 않도록)
+            graph.add(
+                "store",
+                lambda fetched, paper_info, review, images, _uploaded: store_paper(
+                    fetched, paper_info, review, images, manager, paper_id, pdf_url
+                ),
+                deps=["fetch", "info", "review", "images", "upload_images"],
+            )
+
+        try:
+            if upload:
+                graph.result("upload_images")
+                paper = graph.result("store")
+            else:
+                paper_info, review = graph.result("info"), graph.result("review")
+        except Exception:
+            if upload:
+                # 리뷰가 실패하면 미리 올린 이미지를 정리
+                graph.shutdown()
+                manager.delete_images(paper_id)
+            raise
+
+    print(f"review_pdf stages: {graph.format_timings()}")
+    if timings is not None:
+        timings.update(graph.timings)
 
+    if upload:
         return paper_id, paper
     else:
         return paper_info, review
 
 
-def check_html(url):
+# 이미지 동시 다운로드 수, 이미지당 (connect, read) 타임아웃, 이미지당 최대 크기
+IMAGE_FETCH_CONCURRENCY = 8
+IMAGE_FETCH_TIMEOUT = (5, 20)
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+
+def fetch_image(src):
+    with get_session().get(src, stream=True, timeout=IMAGE_FETCH_TIMEOUT) as response:
+        response.raise_for_status()
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            size += len(chunk)
+            check_size(src, size, MAX_IMAGE_BYTES)
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def fetch_images(srcs):
+    """{src: bytes} for every src that could be fetched, downloaded concurrently."""
+    with ThreadPoolExecutor(max_workers=IMAGE_FETCH_CONCURRENCY) as executor:
+        futures = {src: executor.submit(fetch_image, src) for src in srcs}
+    images = {}
+    for src, future in futures.items():
+        try:
+            images[src] = future.result()
+        except Exception as e:
+            print(f"Failed to fetch image {src}: {e}")
+    return images
+
+
+def check_html(url, encode_images=True):
+    """
+    encode_images=False keeps the raw bytes under "data" instead of base64 under "image",
+    for callers that upload the images straight to storage.
+    """
+    html_json = fetch_arxiv_html(url)
+    if html_json is None:
+        return None
+    html_json["images"] = get_image_files(html_json.pop("image_sources"), encode_images)
+    return html_json
+
+
+def get_image_files(sources, encode_images=True):
+    """Fetch {image_name: src} into image dicts (see check_html)."""
+    fetched = fetch_images(set(sources.values()))
+    image_files = []
+    for name, src in sources.items():
+        if src not in fetched:
+            continue
+        if encode_images:
+            image_files.append({"image_name": name, "image": base64.b64encode(fetched[src])})
+        else:
+            image_files.append({"image_name": name, "data": fetched[src]})
+    return image_files
+
+
+def fetch_arxiv_html(url):
+    """
+    Text and figures of an arXiv HTML paper, with the image URLs left unfetched
+    under "image_sources" ({image_name: src}). None if there is no HTML version.
+    """
 
     if url.startswith("https://arxiv.org/html/"):
         html_url = url  
@@ -211,47 +359,40 @@ def check_html(url):
     
     print(f"Checking HTML: {html_url}")
 
-    content = requests.get(html_url).text
-    soup = BeautifulSoup(content, 'html.parser')
-    # article.ltx_document
-    article = soup.find("article", class_="ltx_document")
-    if article:
-        images = article.find_all("img")
-        image_files = []
+    content = get_session().get(html_url, timeout=IMAGE_FETCH_TIMEOUT).text
+    # article.ltx_document -> 섹션, 수식(LaTeX), 그림/표 id를 유지한 간결한 마크다운
+    article, text = extract_arxiv_html(content)
+    if article is not None:
+        images = article.xpath(".//img")
 
+        # 같은 이미지가 여러 번 나와도 한 번만 받음
+        sources = {}
         for img in images:
             src = img.get("src")
             name = src
-            if src.startswith("data:image"):
+            if not src or src.startswith("data:image") or name in sources:
                 continue
-            if not src.startswith("https://") or not src.startswith("http://"):
+            if not src.startswith("https://") and not src.startswith("http://"):
                 if src.startswith("/"):
                     src = f"https://arxiv.org{src}"
                 else:
                     src = f"{html_url}/{src}"
-                
-            img_content = requests.get(src).content
-            img_content = base64.b64encode(img_content)
-            image_files.append({
-                "image_name": name,
-                "image": img_content
-            })
+            sources[name] = src
 
 
-        figures = article.find_all("figure")
+        figures = article.xpath(".//figure")
         figure_outputs = []
         for fig in figures:
             figid = fig.get("id")
             figure_outputs.append({
                 "figure_id": figid,
-                "content": markdownify.markdownify(str(fig))
+                "content": markdownify.markdownify(lxml.html.tostring(fig, encoding="unicode", with_tail=False))
             })
 
 
-        text = article.prettify()
         return {
             "text": text,
-            "images": image_files,
+            "image_sources": sources,
             "figures": figure_outputs
         }
     return None
@@ -0,0 +1,285 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# 리뷰 전문 검색용 로컬 SQLite FTS5 인덱스
+SEARCH_INDEX_PATH = os.environ.get("SEARCH_INDEX_PATH", "cache/search_index.sqlite")
+# 다른 프로세스(봇)가 추가한 논문을 가져오는 주기와 삭제된 논문을 정리하는 주기 (초)
+SEARCH_SYNC_INTERVAL = 30
+SEARCH_RECONCILE_INTERVAL = 600
+
+INDEXED_FIELDS = ["title", "authors", "abstract", "tldr", "review"]
+# bm25 가중치 (INDEXED_FIELDS 순서)
+FIELD_WEIGHTS = [10.0, 5.0, 3.0, 3.0, 1.0]
+
+HANGUL_RUN = re.compile(r"[가-힣]+")
+WORD = re.compile(r"[가-힣]+|[^\W_]+")
+# 검색어 끝에 붙는 흔한 조사 (긴 것부터)
+JOSA = sorted(
+    ["은", "는", "이", "가", "을", "를", "의", "에", "에서", "에게", "으로", "로", "와", "과",
+     "도", "만", "까지", "부터", "이다", "이나", "나", "란", "이란", "처럼", "보다"],
+    key=len, reverse=True,
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS papers (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT UNIQUE NOT NULL,
+    title TEXT NOT NULL,
+    tldr TEXT NOT NULL,
+    review_time TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+    {", ".join(INDEXED_FIELDS)}, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def strip_josa(word):
+    for josa in JOSA:
+        if len(word) > len(josa) + 1 and word.endswith(josa):
+            return word[:-len(josa)]
+    return word
+
+
+def bigrams(word):
+    return [word[i:i + 2] for i in range(len(word) - 1)]
+
+
+def tokenize_korean(text):
+    """
+    Text as stored in the FTS table: every Hangul word is followed by its stem
+    (trailing particle removed) and the stem's character bigrams, so "트랜스포머를"
+    is found by "트랜스포머" and by "트랜스".
+    """
+    def expand(match):
+        word = match.group(0)
+        stem = strip_josa(word)
+        tokens = [word] + ([stem] if stem != word else []) + bigrams(stem)
+        return " " + " ".join(tokens) + " "
+    return HANGUL_RUN.sub(expand, text or "")
+
+
+def build_match_query(query):
+    """FTS5 MATCH expression: all terms must match, Latin terms as prefixes."""
+    terms = []
+    for word in WORD.findall(query.lower()):
+        if HANGUL_RUN.fullmatch(word):
+            stem = strip_josa(word)
+            if len(stem) < 2:
+                terms.append(f'"{stem}"*')
+            else:
+                # 인접한 bigram 구(phrase)로 찾으므로 띄어 쓴 합성어 안쪽도 일치
+                terms.append('"' + " ".join(bigrams(stem)) + '"')
+        else:
+            terms.append(f'"{word}"*')
+    return " AND ".join(terms)
+
+
+class SearchIndex:
+    """
+    Full-text index over reviewed papers with BM25 ranking. Search results carry the
+    index card fields (title, tldr, review_time), so listing them needs no Firestore read.
+    """
+
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._last_sync = 0
+        self._last_reconcile = 0
+        # 동시에 한 번만 sync/rebuild
+        self._sync_lock = threading.Lock()
+        self._sync_thread = None
+        # ":memory:"는 연결마다 다른 DB이므로 연결 하나를 공유
+        self._shared = self._connect() if path == ":memory:" else None
+        self._conn().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self):
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _upsert(self, conn, paper_id, paper):
+        self._delete(conn, paper_id)
+        card = paper.get("card") or {}
+        review_time = paper["review_time"]
+        if isinstance(review_time, datetime):
+            review_time = review_time.isoformat()
+        cur = conn.execute(
+            "INSERT INTO papers (id, title, tldr, review_time) VALUES (?, ?, ?, ?)",
+            (paper_id, card.get("title", paper.get("title", "")), card.get("tldr", paper.get("tldr", "")), review_time),
+        )
+        conn.execute(
+            f"INSERT INTO papers_fts (rowid, {', '.join(INDEXED_FIELDS)}) VALUES (?{', ?' * len(INDEXED_FIELDS)})",
+            [cur.lastrowid] + [tokenize_korean(paper.get(field, "")) for field in INDEXED_FIELDS],
+        )
+
+    def _delete(self, conn, paper_id):
+        row = conn.execute("SELECT rowid FROM papers WHERE id = ?", (paper_id,)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM papers_fts WHERE rowid = ?", row)
+            conn.execute("DELETE FROM papers WHERE rowid = ?", row)
+
+    def add(self, paper_id, paper):
+        """paper: a PaperStore or its dict (title, authors, abstract, tldr, review, review_time, card)."""
+        if not isinstance(paper, dict):
+            paper = paper.model_dump()
+        self.add_many([(paper_id, paper)])
+
+    def add_many(self, papers):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                for paper_id, paper in papers:
+                    self._upsert(conn, paper_id, paper)
+
+    def remove(self, paper_id):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._delete(conn, paper_id)
+
+    def ids(self):
+        return {row[0] for row in self._conn().execute("SELECT id FROM papers")}
+
+    def latest_review_time(self):
+        row = self._conn().execute("SELECT max(review_time) FROM papers").fetchone()
+        return datetime.fromisoformat(row[0]) if row[0] else None
+
+    def search(self, query, limit=10, offset=0):
+        """Best matches first: [{"id", "title", "tldr", "review_time"}, ...]."""
+        match = build_match_query(query)
+        if not match:
+            return []
+        rows = self._conn().execute(
+            f"""SELECT p.id, p.title, p.tldr, p.review_time
+                FROM papers_fts JOIN papers p ON p.rowid = papers_fts.rowid
+                WHERE papers_fts MATCH ?
+                ORDER BY bm25(papers_fts, {", ".join(map(str, FIELD_WEIGHTS))})
+                LIMIT ? OFFSET ?""",
+            (match, limit, offset),
+        ).fetchall()
+        return [
+            {"id": r[0], "title": r[1], "tldr": r[2], "review_time": datetime.fromisoformat(r[3])}
+            for r in rows
+        ]
+
+    def rebuild(self, manager):
+        """Re-index every paper in Firestore."""
+        start = time.perf_counter()
+        docs = manager.collection.select(INDEXED_FIELDS + ["review_time", "card"]).stream()
+        papers = [(doc.id, doc.to_dict()) for doc in docs]
+        papers = [(paper_id, paper) for paper_id, paper in papers if paper and "review_time" in paper]
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM papers_fts")
+                conn.execute("DELETE FROM papers")
+                for paper_id, paper in papers:
+                    self._upsert(conn, paper_id, paper)
+        self._last_sync = self._last_reconcile = time.time()
+        print(f"Indexed {len(papers)} papers in {time.perf_counter() - start:0.1f}s")
+        return len(papers)
+
+    def sync(self, manager, force=False):
+        """
+        Pick up papers written by other processes: new papers every SEARCH_SYNC_INTERVAL
+        seconds, deleted papers every SEARCH_RECONCILE_INTERVAL seconds. Returns at once
+        if another thread is already syncing.
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._sync(manager, force)
+        finally:
+            self._sync_lock.release()
+
+    def _sync(self, manager, force):
+        now = time.time()
+        if not force and now - self._last_sync < SEARCH_SYNC_INTERVAL:
+            return
+        self._last_sync = now
+        if not self.ids():
+            self.rebuild(manager)
+            return
+
+        latest = self.latest_review_time()
+        query = manager.collection.select(INDEXED_FIELDS + ["review_time", "card"])
+        if latest is not None:
+            query = query.where("review_time", ">", latest)
+        papers = [(doc.id, doc.to_dict()) for doc in query.stream()]
+        papers = [(paper_id, paper) for paper_id, paper in papers if paper and "review_time" in paper]
+        if papers:
+            self.add_many(papers)
+
+        if force or now - self._last_reconcile >= SEARCH_RECONCILE_INTERVAL:
+            self._last_reconcile = now
+            # 문서 이름만 읽어서 다른 곳에서 삭제된 논문을 인덱스에서 제거
+            existing = {doc.id for doc in manager.collection.select([]).stream()}
+            for paper_id in self.ids() - existing:
+                self.remove(paper_id)
+
+    def start_background_sync(self, manager, interval=SEARCH_SYNC_INTERVAL):
+        """
+        Keep the index in step with Firestore from a daemon thread (building it first if
+        empty), so searches only ever read the local index.
+        """
+        if self._sync_thread is not None and self._sync_thread.is_alive():
+            return self._sync_thread
+
+        def run():
+            while True:
+                try:
+                    self.sync(manager)
+                except Exception as e:
+                    # Firestore에 닿지 않으면 가지고 있는 인덱스로 계속 검색
+                    print(f"Search index sync failed: {e}")
+                time.sleep(interval)
+
+        self._sync_thread = threading.Thread(target=run, name="search-index-sync", daemon=True)
+        self._sync_thread.start()
+        return self._sync_thread
+
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def get_search_index():
+    global _search_index
+    with _search_index_lock:
+        if _search_index is None:
+            _search_index = SearchIndex()
+        return _search_index
+
+
+if __name__ == "__main__":
+    # python -m ai_reviewer.search_index  (Firestore에서 인덱스 다시 만들기)
+    # python -m ai_reviewer.search_index "검색어"
+    import sys
+    from ai_reviewer.firebase_utils import FirebaseManager
+
+    index = get_search_index()
+    if len(sys.argv) > 1:
+        start = time.perf_counter()
+        results = index.search(" ".join(sys.argv[1:]))
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:0.1f}ms")
+        for result in results:
+            print(result["id"], result["title"])
+    else:
+        index.rebuild(FirebaseManager())
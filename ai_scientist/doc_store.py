@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class DocumentStore:
+    """
+    Parsed documents (markdown text, images, figures) on disk, keyed by the SHA-256 of
+    the source file plus the parser name and version, so the same PDF is parsed once
+    no matter which URL, upload or command it came from.
+    Layout: `<root>/<sha256[:2]>/<sha256>/<parser>@<version>.json`.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        # One lock per key so concurrent requests for the same document parse it once.
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._async_locks = {}
+
+    def path(self, sha256, parser, version):
+        name = re.sub(r"[^A-Za-z0-9_.+-]", "_", f"{parser}@{version}")
+        return os.path.join(self.root, sha256[:2], sha256, name + ".json")
+
+    def get(self, sha256, parser, version):
+        path = self.path(sha256, parser, version)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, sha256, parser, version, document):
+        path = self.path(sha256, parser, version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get_or_parse(self, file_path, parser, version, parse_fn):
+        """
+        Return the stored document for `file_path`, calling `parse_fn(file_path)` and
+        storing its result (a JSON-serializable dict) only on a miss.
+        """
+        sha256 = hash_file(file_path)
+        key = (sha256, parser, version)
+        with self._locks_lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            document = self.get(*key)
+            if document is not None:
+                self.hits += 1
+                print(f"Parsed document found in store ({parser}, {sha256[:12]}).")
+                return document
+            self.misses += 1
+            document = parse_fn(file_path)
+            self.put(*key, document)
+        return document
+
+    async def aget_or_parse(self, file_path, parser, version, aparse_fn):
+        """Async version of get_or_parse; `aparse_fn(file_path)` is awaited on a miss."""
+        sha256 = await asyncio.to_thread(hash_file, file_path)
+        key = (sha256, parser, version)
+        lock = self._async_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            document = await asyncio.to_thread(self.get, *key)
+            if document is not None:
+                self.hits += 1
+                print(f"Parsed document found in store ({parser}, {sha256[:12]}).")
+                return document
+            self.misses += 1
+            document = await aparse_fn(file_path)
+            await asyncio.to_thread(self.put, *key, document)
+        return document
+
+
+_document_store = None
+
+
+def get_document_store():
+    """
+    Return the shared document store, rooted at DOC_STORE_PATH (default "doc_store").
+    """
+    global _document_store
+    if _document_store is None:
+        _document_store = DocumentStore(os.environ.get("DOC_STORE_PATH", "doc_store"))
+    return _document_store
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+DOWNLOAD_DIR = "pdfs"
+MAX_DOWNLOAD_BYTES = int(os.environ.get("DOWNLOAD_MAX_MB", 100)) * 1024 * 1024
+# (connect, read) timeouts in seconds; the read timeout applies between chunks.
+DOWNLOAD_TIMEOUT = (10, 60)
+# Cached files are revalidated with ETag / Last-Modified at most this often.
+REVALIDATE_AFTER = 24 * 3600
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadTooLarge(Exception):
+    pass
+
+
+def normalize_url(url):
+    if url.startswith("https://arxiv.org/abs/"):
+        url = url.replace("abs", "pdf")
+    return url
+
+
+def get_cache_paths(url, download_dir=DOWNLOAD_DIR, suffix=".pdf"):
+    url_hash = hashlib.md5(url.encode()).hexdigest()
+    path = os.path.join(download_dir, url_hash + suffix)
+    return path, path + ".meta.json"
+
+
+def load_meta(meta_path):
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as f:
+        return json.load(f)
+
+
+def save_meta(meta_path, url, headers):
+    meta = {
+        "url": url,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "checked": time.time(),
+    }
+    tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def touch_meta(meta_path, meta):
+    save_meta(
+        meta_path,
+        meta["url"],
+        {"ETag": meta.get("etag"), "Last-Modified": meta.get("last_modified")},
+    )
+
+
+def get_revalidation_headers(path, meta):
+    """
+    None if the cached file can be used as is, otherwise the headers for the request
+    (conditional when the cached file has validators).
+    """
+    if not os.path.exists(path):
+        return {}
+    if meta is None:
+        # Downloaded before validators were recorded.
+        return None
+    if time.time() - meta["checked"] < REVALIDATE_AFTER:
+        return None
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers or None
+
+
+def check_size(url, size, max_bytes):
+    if max_bytes is not None and size > max_bytes:
+        raise DownloadTooLarge(f"{url} is larger than {max_bytes // (1024 * 1024)} MB")
+
+
+_session = None
+_session_lock = threading.Lock()
+_url_locks = {}
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=2)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def get_url_lock(url):
+    with _session_lock:
+        return _url_locks.setdefault(url, threading.Lock())
+
+
+def download_file(url, path, meta_path, max_bytes=MAX_DOWNLOAD_BYTES, timeout=DOWNLOAD_TIMEOUT):
+    """
+    Stream `url` to `path` through a temp file and an atomic rename.
+    Concurrent calls for the same URL share one download.
+    """
+    with get_url_lock(url):
+        headers = get_revalidation_headers(path, load_meta(meta_path))
+        if headers is None:
+            print("File already downloaded.")
+            return path
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with get_session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 304:
+                touch_meta(meta_path, load_meta(meta_path))
+                return path
+            response.raise_for_status()
+            check_size(url, int(response.headers.get("Content-Length") or 0), max_bytes)
+
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            size = 0
+            try:
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        size += len(chunk)
+                        check_size(url, size, max_bytes)
+                        f.write(chunk)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            save_meta(meta_path, url, response.headers)
+    return path
+
+
+def download_pdf(url, download_dir=DOWNLOAD_DIR, **kwargs):
+    url = normalize_url(url)
+    path, meta_path = get_cache_paths(url, download_dir)
+    return download_file(url, path, meta_path, **kwargs)
+
+
+# aiohttp sessions are bound to the event loop they were created on.
+_async_sessions = {}
+_async_url_locks = {}
+
+
+def get_async_session():
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=16))
+        _async_sessions[loop] = session
+    return session
+
+
+async def adownload_file(url, path, meta_path, max_bytes=MAX_DOWNLOAD_BYTES, timeout=DOWNLOAD_TIMEOUT):
+    """
+    Async version of download_file.
+    """
+    import aiohttp
+
+    lock = _async_url_locks.setdefault(url, asyncio.Lock())
+    async with lock:
+        headers = get_revalidation_headers(path, load_meta(meta_path))
+        if headers is None:
+            print("File already downloaded.")
+            return path
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        async with get_async_session().get(url, headers=headers, timeout=client_timeout) as response:
+            if response.status == 304:
+                touch_meta(meta_path, load_meta(meta_path))
+                return path
+            response.raise_for_status()
+            check_size(url, response.content_length or 0, max_bytes)
+
+            tmp_path = f"{path}.{os.getpid()}.{id(lock)}.tmp"
+            size = 0
+            try:
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        check_size(url, size, max_bytes)
+                        f.write(chunk)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            save_meta(meta_path, url, response.headers)
+    return path
+
+
+async def adownload_pdf(url, download_dir=DOWNLOAD_DIR, **kwargs):
+    url = normalize_url(url)
+    path, meta_path = get_cache_paths(url, download_dir)
+    return await adownload_file(url, path, meta_path, **kwargs)
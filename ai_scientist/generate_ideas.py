@@ -7,6 +7,7 @@ from ai_scientist.llm import get_response_from_llm, extract_json_between_markers
 
 import requests
 import backoff
+from ai_scientist.instrumentation import track_pipeline
 
 S2_API_KEY = os.getenv("S2_API_KEY")
 
@@ -72,6 +73,7 @@ ONLY INCLUDE "I am done" IF YOU ARE MAKING NO MORE CHANGES."""
 
 
 # GENERATE IDEAS
+@track_pipeline("idea_generation")
 def generate_ideas(
     base_dir,
     client,
@@ -357,6 +359,7 @@ A query will work best if you are able to recall the exact name of the paper you
 This JSON will be automatically parsed, so ensure the format is precise.'''
 
 
+@track_pipeline("idea_generation")
 def check_idea_novelty(
     ideas,
     base_dir,
@@ -5,6 +5,7 @@ import time
 from typing import List, Dict, Union
 from ai_scientist.llm import get_response_from_llm, extract_json_between_markers
 import requests
+from ai_scientist.instrumentation import track_pipeline
 
 S2_API_KEY = os.environ.get("S2_API_KEY")
 
@@ -99,6 +100,7 @@ ONLY INCLUDE "I am done" IF YOU ARE MAKING NO MORE CHANGES."""
 
 
 # GENERATE IDEAS
+@track_pipeline("idea_generation")
 def generate_ideas(
     client,
     model,
@@ -286,6 +288,7 @@ A query will work best if you are able to recall the exact name of the paper you
 This JSON will be automatically parsed, so ensure the format is precise.'''
 
 
+@track_pipeline("idea_generation")
 def check_idea_novelty(
     ideas,
     client,
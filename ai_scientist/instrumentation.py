@@ -0,0 +1,265 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Labels for the code currently running: a bot command and/or a pipeline
+# (review, writeup, idea_generation, ...). Context variables follow asyncio
+# tasks and asyncio.to_thread, so nested calls inherit them.
+current_command = contextvars.ContextVar("current_command", default=None)
+current_pipeline = contextvars.ContextVar("current_pipeline", default=None)
+
+# Frames from these modules are skipped when looking for the calling function.
+_INTERNAL_MODULES = (
+    "ai_scientist.instrumentation",
+    "ai_scientist.rate_limit",
+    "ai_scientist.llm",
+    "ai_scientist.llm_cache",
+)
+
+_lock = threading.Lock()
+_totals = {}
+_unpriced_models = set()
+
+# USD per 1M tokens: (input, output, cached input). Dated snapshots fall back to
+# their base model (gpt-4o-2024-11-20 -> gpt-4o); ai_scientist.llm.MODELS reuses these.
+MODEL_PRICES = {
+    "gpt-4o": (2.5, 10.0, 1.25),
+    "gpt-4o-2024-05-13": (5.0, 15.0, 5.0),
+    "gpt-4o-mini": (0.15, 0.6, 0.075),
+    "gpt-4o-mini-search-preview": (0.15, 0.6, 0.15),
+    "gpt-4o-search-preview": (2.5, 10.0, 2.5),
+    "gpt-4.1": (2.0, 8.0, 0.5),
+    "gpt-4.1-mini": (0.4, 1.6, 0.1),
+    "gpt-4.1-nano": (0.1, 0.4, 0.025),
+    "o1": (15.0, 60.0, 7.5),
+    "o3": (2.0, 8.0, 0.5),
+    "o3-mini": (1.1, 4.4, 0.55),
+    "o4-mini": (1.1, 4.4, 0.275),
+    "deepseek-coder": (0.14, 0.28, 0.014),
+    "deepseek-chat": (0.27, 1.1, 0.07),
+    "meta-llama/llama-3.1-405b-instruct": (3.0, 3.0, 3.0),
+    "claude-3-5-sonnet": (3.0, 15.0, 0.3),
+    "claude-3-7-sonnet": (3.0, 15.0, 0.3),
+    "claude-sonnet-4": (3.0, 15.0, 0.3),
+    "claude-3-5-haiku": (0.8, 4.0, 0.08),
+}
+
+
+def set_command(command):
+    return current_command.set(command)
+
+
+def track_pipeline(pipeline):
+    """Decorator labelling every LLM call made inside the function with `pipeline`."""
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                token = current_pipeline.set(pipeline)
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    current_pipeline.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = current_pipeline.set(pipeline)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                current_pipeline.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+def get_caller():
+    frame = inspect.currentframe()
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module not in _INTERNAL_MODULES and not module.startswith(("asyncio", "concurrent", "threading", "contextvars")):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def get_usage(response):
+    """
+    Return (prompt_tokens, completion_tokens, cached_prompt_tokens) from an
+    OpenAI / Anthropic / litellm response. prompt_tokens includes the cached ones.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0, 0
+    prompt = getattr(usage, "prompt_tokens", None)
+    if prompt is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", 0) or 0
+        return prompt, getattr(usage, "completion_tokens", 0) or 0, cached
+    # Anthropic reports cache reads and writes separately from input_tokens.
+    cached = getattr(usage, "cache_read_input_tokens", 0) or 0
+    prompt = (
+        (getattr(usage, "input_tokens", 0) or 0)
+        + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+        + cached
+    )
+    return prompt, getattr(usage, "output_tokens", 0) or 0, cached
+
+
+def get_model_price(model):
+    """(input, output, cached input) USD per 1M tokens, or None for unknown models."""
+    for name in (model, model.split("/")[-1]):
+        price = MODEL_PRICES.get(name) or MODEL_PRICES.get(re.sub(r"-(\d{4}-\d{2}-\d{2}|\d{8})$", "", name))
+        if price is not None:
+            return price
+    return None
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_prompt_tokens=0):
+    """USD cost of one call, or None (with a one-time warning) if the model has no price."""
+    price = get_model_price(model)
+    if price is None:
+        from ai_scientist.llm import MODELS
+
+        # MODELS aliases such as "deepseek-coder-v2-0724"
+        spec = MODELS.get(model)
+        price = get_model_price(spec.model_id) if spec is not None else None
+    if price is None:
+        if model not in _unpriced_models:
+            _unpriced_models.add(model)
+            print(f"No price for model {model}; its calls are counted in llm_unpriced_calls_total, not in cost.")
+        return None
+    input_price, output_price, cached_input_price = price
+    return (
+        (prompt_tokens - cached_prompt_tokens) * input_price
+        + cached_prompt_tokens * cached_input_price
+        + completion_tokens * output_price
+    ) / 1e6
+
+
+def record_call(model, response=None, latency=0.0, cached=False, stream=False):
+    """
+    Record one LLM call (or cache hit) under the current command/pipeline labels.
+    Set LLM_METRICS_PATH to also append each call as a JSON line.
+    """
+    prompt_tokens, completion_tokens, cached_prompt_tokens = get_usage(response)
+    record = {
+        "time": time.time(),
+        "model": model,
+        "command": current_command.get(),
+        "pipeline": current_pipeline.get(),
+        "caller": get_caller(),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_prompt_tokens": cached_prompt_tokens,
+        "cost": estimate_cost(model, prompt_tokens, completion_tokens, cached_prompt_tokens),
+        "latency": latency,
+        "cache_hit": cached,
+        "stream": stream,
+    }
+
+    key = (record["pipeline"] or "", record["command"] or "", model)
+    with _lock:
+        totals = _totals.setdefault(
+            key,
+            {
+                "calls": 0,
+                "cache_hits": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached_prompt_tokens": 0,
+                "cost": 0.0,
+                "unpriced_calls": 0,
+                "latency_seconds": 0.0,
+            },
+        )
+        totals["calls"] += 1
+        totals["cache_hits"] += int(cached)
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+        totals["cached_prompt_tokens"] += cached_prompt_tokens
+        if record["cost"] is None:
+            totals["unpriced_calls"] += 1
+        else:
+            totals["cost"] += record["cost"]
+        totals["latency_seconds"] += latency
+
+        path = os.environ.get("LLM_METRICS_PATH")
+        if path:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return record
+
+
+def get_llm_metrics():
+    """Aggregated totals keyed by "pipeline/command/model"."""
+    with _lock:
+        return {"/".join(key): dict(totals) for key, totals in _totals.items()}
+
+
+def render_prometheus():
+    from ai_scientist.rate_limit import get_rate_limit_metrics
+
+    lines = []
+    with _lock:
+        items = sorted(_totals.items())
+    for name, field, kind in [
+        ("llm_calls_total", "calls", "counter"),
+        ("llm_cache_hits_total", "cache_hits", "counter"),
+        ("llm_prompt_tokens_total", "prompt_tokens", "counter"),
+        ("llm_completion_tokens_total", "completion_tokens", "counter"),
+        ("llm_cached_prompt_tokens_total", "cached_prompt_tokens", "counter"),
+        ("llm_cost_usd_total", "cost", "counter"),
+        ("llm_unpriced_calls_total", "unpriced_calls", "counter"),
+        ("llm_latency_seconds_total", "latency_seconds", "counter"),
+    ]:
+        lines.append(f"# TYPE {name} {kind}")
+        for (pipeline, command, model), totals in items:
+            labels = f'pipeline="{pipeline}",command="{command}",model="{model}"'
+            lines.append(f"{name}{{{labels}}} {totals[field]}")
+
+    rate_limits = sorted(get_rate_limit_metrics().items())
+    for name, field in [
+        ("llm_throttle_seconds_total", "throttle_seconds"),
+        ("llm_backoff_seconds_total", "backoff_seconds"),
+        ("llm_retries_total", "retries"),
+    ]:
+        lines.append(f"# TYPE {name} counter")
+        for key, metrics in rate_limits:
+            provider, _, model = key.partition("/")
+            lines.append(f'{name}{{provider="{provider}",model="{model}"}} {metrics[field]}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve render_prometheus() at http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
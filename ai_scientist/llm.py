@@ -1,9 +1,320 @@
 import openai
 import json
+import os
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from ai_scientist.llm_cache import get_llm_cache
+from ai_scientist.instrumentation import record_call, get_model_price
+from ai_scientist.rate_limit import (
+    call_with_rate_limit,
+    acall_with_rate_limit,
+    wait_for_rate_limit,
+    await_rate_limit,
+)
+
+
+class ModelSpec:
+    """
+    Static description of a model: which provider serves it, the model ID sent
+    to that provider, token limits and pricing (USD per 1M tokens, taken from
+    instrumentation.MODEL_PRICES unless given).
+    """
+
+    def __init__(
+        self,
+        provider,
+        model_id,
+        max_tokens=3000,
+        context_window=128000,
+        seed=None,
+        input_price=None,
+        output_price=None,
+        cached_input_price=None,
+    ):
+        price = get_model_price(model_id) or (0.0, 0.0, None)
+        if input_price is None:
+            input_price, output_price = price[0], price[1]
+            if cached_input_price is None:
+                cached_input_price = price[2]
+        self.provider = provider
+        self.model_id = model_id
+        self.max_tokens = max_tokens
+        self.context_window = context_window
+        self.seed = seed
+        self.input_price = input_price
+        self.output_price = output_price
+        # Price of prompt tokens served from the provider's prompt cache.
+        self.cached_input_price = input_price if cached_input_price is None else cached_input_price
+
+
+class OpenAIProvider:
+    """Adapter for OpenAI-compatible chat completion endpoints."""
+
+    supports_n = True
+
+    def __init__(self, name, base_url=None, api_key_env=None):
+        self.name = name
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+
+    def make_async_client(self):
+        kwargs = {}
+        if self.base_url:
+            kwargs["base_url"] = self.base_url
+        if self.api_key_env:
+            kwargs["api_key"] = os.environ[self.api_key_env]
+        return openai.AsyncOpenAI(**kwargs)
+
+    def user_message(self, msg, cache_prefix=None):
+        # Prompt caching is automatic for prefixes of 1024+ tokens; the prefix only has
+        # to be sent byte-identical at the start of the prompt.
+        return {"role": "user", "content": msg}
+
+    def assistant_message(self, content):
+        return {"role": "assistant", "content": content}
+
+    def request_kwargs(self, spec, system_message, messages, temperature, n):
+        kwargs = dict(
+            model=spec.model_id,
+            messages=[
+                {"role": "system", "content": system_message},
+                *messages,
+            ],
+            temperature=temperature,
+            max_tokens=spec.max_tokens,
+            n=n,
+            stop=None,
+        )
+        if spec.seed is not None:
+            kwargs["seed"] = spec.seed
+        return kwargs
+
+    def create(self, client, spec, system_message, messages, temperature, n=1):
+        response = call_with_rate_limit(
+            client.chat.completions.create,
+            provider=self.name,
+            **self.request_kwargs(spec, system_message, messages, temperature, n),
+        )
+        return [r.message.content for r in response.choices]
+
+    async def acreate(self, client, spec, system_message, messages, temperature, n=1):
+        response = await acall_with_rate_limit(
+            client.chat.completions.create,
+            provider=self.name,
+            **self.request_kwargs(spec, system_message, messages, temperature, n),
+        )
+        return [r.message.content for r in response.choices]
+
+    def stream(self, client, spec, system_message, messages, temperature):
+        response = call_with_rate_limit(
+            client.chat.completions.create,
+            provider=self.name,
+            stream=True,
+            # 마지막 청크로 토큰 사용량을 받아서 기록
+            stream_options={"include_usage": True},
+            **self.request_kwargs(spec, system_message, messages, temperature, 1),
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def astream(self, client, spec, system_message, messages, temperature):
+        response = await acall_with_rate_limit(
+            client.chat.completions.create,
+            provider=self.name,
+            stream=True,
+            # 마지막 청크로 토큰 사용량을 받아서 기록
+            stream_options={"include_usage": True},
+            **self.request_kwargs(spec, system_message, messages, temperature, 1),
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class AnthropicProvider:
+    """Adapter for the Anthropic messages API (also Bedrock / Vertex clients)."""
+
+    supports_n = False
+
+    def __init__(self, name):
+        self.name = name
+
+    def make_async_client(self):
+        import anthropic
+
+        return anthropic.AsyncAnthropic()
+
+    def user_message(self, msg, cache_prefix=None):
+        if cache_prefix and msg.startswith(cache_prefix) and len(msg) > len(cache_prefix):
+            # Split the static prefix into its own block with a cache breakpoint.
+            return {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": cache_prefix, "cache_control": {"type": "ephemeral"}},
+                    {"type": "text", "text": msg[len(cache_prefix):]},
+                ],
+            }
+        return {"role": "user", "content": [{"type": "text", "text": msg}]}
+
+    def assistant_message(self, content):
+        return {"role": "assistant", "content": [{"type": "text", "text": content}]}
+
+    def request_kwargs(self, spec, system_message, messages, temperature):
+        return dict(
+            model=spec.model_id,
+            max_tokens=spec.max_tokens,
+            temperature=temperature,
+            system=system_message,
+            messages=with_rolling_cache_breakpoint(messages),
+        )
+
+    def create(self, client, spec, system_message, messages, temperature, n=1):
+        assert n == 1, f"{self.name} does not support n > 1"
+        response = call_with_rate_limit(
+            client.messages.create,
+            provider=self.name,
+            **self.request_kwargs(spec, system_message, messages, temperature),
+        )
+        return [response.content[0].text]
+
+    async def acreate(self, client, spec, system_message, messages, temperature, n=1):
+        assert n == 1, f"{self.name} does not support n > 1"
+        response = await acall_with_rate_limit(
+            client.messages.create,
+            provider=self.name,
+            **self.request_kwargs(spec, system_message, messages, temperature),
+        )
+        return [response.content[0].text]
+
+    def stream(self, client, spec, system_message, messages, temperature):
+        kwargs = self.request_kwargs(spec, system_message, messages, temperature)
+        recorder = wait_for_rate_limit(provider=self.name, **kwargs)
+        final = None
+        try:
+            with client.messages.stream(**kwargs) as stream:
+                yield from stream.text_stream
+                final = stream.get_final_message()
+        finally:
+            recorder.finish(final)
+
+    async def astream(self, client, spec, system_message, messages, temperature):
+        kwargs = self.request_kwargs(spec, system_message, messages, temperature)
+        recorder = await await_rate_limit(provider=self.name, **kwargs)
+        final = None
+        try:
+            async with client.messages.stream(**kwargs) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                final = await stream.get_final_message()
+        finally:
+            recorder.finish(final)
+
+
+def with_rolling_cache_breakpoint(messages):
+    """
+    Copy of `messages` with a cache breakpoint on the last block, so the next turn of
+    the same conversation (e.g. a reflection round) reads everything before it from cache.
+    """
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = content[:-1] + [{**content[-1], "cache_control": {"type": "ephemeral"}}]
+    return messages[:-1] + [{**last, "content": content}]
+
+
+PROVIDERS = {
+    "openai": OpenAIProvider("openai"),
+    "deepseek": OpenAIProvider(
+        "deepseek", base_url="https://api.deepseek.com", api_key_env="DEEPSEEK_API_KEY"
+    ),
+    "openrouter": OpenAIProvider(
+        "openrouter", base_url="https://openrouter.ai/api/v1", api_key_env="OPENROUTER_API_KEY"
+    ),
+    "anthropic": AnthropicProvider("anthropic"),
+}
+
+MODELS = {
+    "gpt-4o-2024-05-13": ModelSpec("openai", "gpt-4o-2024-05-13", seed=0),
+    "gpt-4o-mini-2024-07-18": ModelSpec("openai", "gpt-4o-mini-2024-07-18", seed=0),
+    "gpt-4o-2024-08-06": ModelSpec("openai", "gpt-4o-2024-08-06", seed=0),
+    "gpt-4.1": ModelSpec("openai", "gpt-4.1", context_window=1047576, seed=0),
+    "gpt-4.1-mini": ModelSpec("openai", "gpt-4.1-mini", context_window=1047576, seed=0),
+    "deepseek-coder-v2-0724": ModelSpec("deepseek", "deepseek-coder"),
+    "llama-3-1-405b-instruct": ModelSpec("openrouter", "meta-llama/llama-3.1-405b-instruct"),
+    "meta-llama/llama-3.1-405b-instruct": ModelSpec(
+        "openrouter", "meta-llama/llama-3.1-405b-instruct"
+    ),
+    "claude-3-5-sonnet-20240620": ModelSpec(
+        "anthropic", "claude-3-5-sonnet-20240620", context_window=200000
+    ),
+}
+
+
+def get_model_spec(model):
+    spec = MODELS.get(model)
+    if spec is None and "claude" in model:
+        # Bedrock / Vertex model IDs and newer Claude releases all use the Anthropic adapter.
+        spec = ModelSpec("anthropic", model, context_window=200000)
+    if spec is None:
+        raise ValueError(f"Model {model} not supported.")
+    return spec
+
+
+def get_cache_key(model, system_message, msg_history, msg, temperature, n_responses=1):
+    # Only deterministic calls are cached: temperature 0, or a seeded model.
+    cache = get_llm_cache()
+    if cache is None or not (temperature == 0 or get_model_spec(model).seed is not None):
+        return None, None
+    key = cache.make_key(
+        model,
+        system_message,
+        msg_history + [{"role": "user", "content": msg}],
+        temperature,
+        n_responses=n_responses,
+    )
+    return cache, key
+
+
+# Upper bound on concurrent requests when a provider has no native `n`.
+MAX_CONCURRENT_REQUESTS = 8
+
+
+def collect_fan_out_results(results):
+    """
+    Split fanned-out (content, msg_history) results, in request order.
+    Failed requests (exceptions) are dropped; only an all-failed fan-out raises.
+    """
+    content, new_msg_history = [], []
+    errors = []
+    for idx, result in enumerate(results):
+        if isinstance(result, BaseException):
+            print(f"Response {idx} failed: {result}")
+            errors.append(result)
+            continue
+        content.append(result[0])
+        new_msg_history.append(result[1])
+    if not content and errors:
+        raise errors[-1]
+    return content, new_msg_history
+
+
+def print_llm_debug(msg_history, content):
+    print()
+    print("*" * 20 + " LLM START " + "*" * 20)
+    for j, msg in enumerate(msg_history):
+        print(f'{j}, {msg["role"]}: {msg["content"]}')
+    print(content)
+    print("*" * 21 + " LLM END " + "*" * 21)
+    print()
 
 
 # Get N responses from a single message, used for ensembling.
-# @backoff.on_exception(backoff.expo, (openai.RateLimitError, openai.APITimeoutError))
 def get_batch_responses_from_llm(
     msg,
     client,
@@ -13,100 +324,68 @@ def get_batch_responses_from_llm(
     msg_history=None,
     temperature=0.75,
     n_responses=1,
+    max_concurrency=None,
+    cache_prefix=None,
 ):
+    """
+    cache_prefix: static leading part of `msg` (e.g. instructions and few-shot examples)
+    that providers with explicit prompt caching mark as cacheable.
+    """
     if msg_history is None:
         msg_history = []
+    spec = get_model_spec(model)
+    provider = PROVIDERS[spec.provider]
+    cache, cache_key = get_cache_key(
+        model, system_message, msg_history, msg, temperature, n_responses
+    )
+    cached = cache.get(cache_key) if cache is not None else None
 
-    if model in [
-        "gpt-4o-2024-05-13",
-        "gpt-4o-mini-2024-07-18",
-        "gpt-4o-2024-08-06",
-        "gpt-4.1",
-        "gpt-4.1-mini"
-    ]:
-        new_msg_history = msg_history + [{"role": "user", "content": msg}]
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_message},
-                *new_msg_history,
-            ],
-            temperature=temperature,
-            max_tokens=3000,
-            n=n_responses,
-            stop=None,
-            seed=0,
-        )
-        content = [r.message.content for r in response.choices]
-        new_msg_history = [
-            new_msg_history + [{"role": "assistant", "content": c}] for c in content
-        ]
-    elif model == "deepseek-coder-v2-0724":
-        new_msg_history = msg_history + [{"role": "user", "content": msg}]
-        response = client.chat.completions.create(
-            model="deepseek-coder",
-            messages=[
-                {"role": "system", "content": system_message},
-                *new_msg_history,
-            ],
-            temperature=temperature,
-            max_tokens=3000,
-            n=n_responses,
-            stop=None,
+    if cached is not None:
+        content, new_msg_history = cached
+        record_call(model, cached=True)
+    elif provider.supports_n:
+        new_msg_history = msg_history + [provider.user_message(msg, cache_prefix)]
+        content = provider.create(
+            client, spec, system_message, new_msg_history, temperature, n=n_responses
         )
-        content = [r.message.content for r in response.choices]
         new_msg_history = [
-            new_msg_history + [{"role": "assistant", "content": c}] for c in content
+            new_msg_history + [provider.assistant_message(c)] for c in content
         ]
-    elif model == "llama-3-1-405b-instruct":
-        new_msg_history = msg_history + [{"role": "user", "content": msg}]
-        response = client.chat.completions.create(
-            model="meta-llama/llama-3.1-405b-instruct",
-            messages=[
-                {"role": "system", "content": system_message},
-                *new_msg_history,
-            ],
-            temperature=temperature,
-            max_tokens=3000,
-            n=n_responses,
-            stop=None,
-        )
-        content = [r.message.content for r in response.choices]
-        new_msg_history = [
-            new_msg_history + [{"role": "assistant", "content": c}] for c in content
-        ]
-    elif "claude" in model:
-        content, new_msg_history = [], []
-        for _ in range(n_responses):
-            c, hist = get_response_from_llm(
-                msg,
-                client,
-                model,
-                system_message,
-                print_debug=False,
-                msg_history=None,
-                temperature=temperature,
-            )
-            content.append(c)
-            new_msg_history.append(hist)
     else:
-        # TODO: This is only supported for GPT-4 in our reviewer pipeline.
-        raise ValueError(f"Model {model} not supported.")
+        # No native `n`: fan the requests out concurrently instead.
+        max_workers = min(n_responses, max_concurrency or MAX_CONCURRENT_REQUESTS)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Each worker runs in a copy of this context so command/pipeline labels carry over.
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    get_response_from_llm,
+                    msg,
+                    client,
+                    model,
+                    system_message,
+                    print_debug=False,
+                    msg_history=msg_history,
+                    temperature=temperature,
+                    cache_prefix=cache_prefix,
+                )
+                for _ in range(n_responses)
+            ]
+            content, new_msg_history = collect_fan_out_results(
+                [future.exception() or future.result() for future in futures]
+            )
+
+    # Partially failed fan-outs are not cached.
+    if cache is not None and cached is None and len(content) == n_responses:
+        cache.set(cache_key, [content, new_msg_history])
 
     if print_debug:
         # Just print the first one.
-        print()
-        print("*" * 20 + " LLM START " + "*" * 20)
-        for j, msg in enumerate(new_msg_history[0]):
-            print(f'{j}, {msg["role"]}: {msg["content"]}')
-        print(content)
-        print("*" * 21 + " LLM END " + "*" * 21)
-        print()
+        print_llm_debug(new_msg_history[0], content)
 
     return content, new_msg_history
 
 
-# @backoff.on_exception(backoff.expo, (openai.RateLimitError, openai.APITimeoutError))
 def get_response_from_llm(
     msg,
     client,
@@ -115,108 +394,285 @@ def get_response_from_llm(
     print_debug=False,
     msg_history=None,
     temperature=0.75,
+    cache_prefix=None,
 ):
     if msg_history is None:
         msg_history = []
+    spec = get_model_spec(model)
+    provider = PROVIDERS[spec.provider]
+    cache, cache_key = get_cache_key(model, system_message, msg_history, msg, temperature)
+    cached = cache.get(cache_key) if cache is not None else None
 
-    if "claude" in model:
-        new_msg_history = msg_history + [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": msg,
-                    }
-                ],
-            }
-        ]
-        response = client.messages.create(
-            model=model,
-            max_tokens=3000,
-            temperature=temperature,
-            system=system_message,
-            messages=new_msg_history,
+    if cached is not None:
+        content, new_msg_history = cached
+        record_call(model, cached=True)
+    else:
+        new_msg_history = msg_history + [provider.user_message(msg, cache_prefix)]
+        content = provider.create(client, spec, system_message, new_msg_history, temperature)[0]
+        new_msg_history = new_msg_history + [provider.assistant_message(content)]
+        if cache is not None:
+            cache.set(cache_key, [content, new_msg_history])
+
+    if print_debug:
+        print_llm_debug(new_msg_history, content)
+
+    return content, new_msg_history
+
+
+# One async client (and therefore one pooled HTTP connection pool) per provider.
+# (provider or sync-client settings, event loop) -> async client. Clients pool
+# connections on the loop that first used them, so each loop gets its own.
+_async_clients = {}
+_async_clients_lock = threading.Lock()
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _cached_async_client(key, make_client):
+    loop = _running_loop()
+    with _async_clients_lock:
+        client = _async_clients.get((key, loop))
+        if client is None:
+            # 닫힌 루프(asyncio.run 호출이 끝난 경우)의 클라이언트는 버림
+            for stale in [k for k in _async_clients if k[1] is not None and k[1].is_closed()]:
+                del _async_clients[stale]
+            client = _async_clients[(key, loop)] = make_client()
+        return client
+
+
+def get_async_client(provider):
+    """
+    Return the async client for a provider on the running event loop, creating it on first use.
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Provider {provider} not supported.")
+    return _cached_async_client(provider, PROVIDERS[provider].make_async_client)
+
+
+def _anthropic():
+    try:
+        import anthropic
+    except ImportError:
+        return None
+    return anthropic
+
+
+def is_async_client(client):
+    if isinstance(client, openai.AsyncOpenAI):
+        return True
+    anthropic = _anthropic()
+    return anthropic is not None and isinstance(
+        client, (anthropic.AsyncAnthropic, anthropic.AsyncAnthropicBedrock, anthropic.AsyncAnthropicVertex)
+    )
+
+
+def _resolve_async_client(client, model):
+    """
+    The async client to use for `client`: async clients as they are, plain sync
+    OpenAI / Anthropic clients as an async client with the same base_url and api_key,
+    None as the provider's default client. Other sync clients (Azure, Bedrock,
+    Vertex) need an async client passed explicitly.
+    """
+    if client is None:
+        return get_async_client(get_model_spec(model).provider)
+    if is_async_client(client):
+        return client
+    if type(client) is openai.OpenAI:
+        key = ("openai", str(client.base_url), client.api_key)
+        return _cached_async_client(
+            key, lambda: openai.AsyncOpenAI(base_url=client.base_url, api_key=client.api_key)
         )
-        content = response.content[0].text
-        new_msg_history = new_msg_history + [
-            {
-                "role": "assistant",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": content,
-                    }
-                ],
-            }
-        ]
-    elif model in [
-        "gpt-4o-2024-05-13",
-        "gpt-4o-mini-2024-07-18",
-        "gpt-4o-2024-08-06",
-        "gpt-4.1",
-        "gpt-4.1-mini"
-    ]:
-        new_msg_history = msg_history + [{"role": "user", "content": msg}]
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_message},
-                *new_msg_history,
-            ],
-            temperature=temperature,
-            max_tokens=3000,
-            n=1,
-            stop=None,
-            seed=0,
+    anthropic = _anthropic()
+    if anthropic is not None and type(client) is anthropic.Anthropic:
+        key = ("anthropic", str(client.base_url), client.api_key)
+        return _cached_async_client(
+            key, lambda: anthropic.AsyncAnthropic(base_url=client.base_url, api_key=client.api_key)
         )
-        content = response.choices[0].message.content
-        new_msg_history = new_msg_history + [{"role": "assistant", "content": content}]
-    elif model == "deepseek-coder-v2-0724":
-        new_msg_history = msg_history + [{"role": "user", "content": msg}]
-        response = client.chat.completions.create(
-            model="deepseek-coder",
-            messages=[
-                {"role": "system", "content": system_message},
-                *new_msg_history,
-            ],
-            temperature=temperature,
-            max_tokens=3000,
-            n=1,
-            stop=None,
+    raise TypeError(f"Pass an async client for {type(client).__name__} (e.g. the matching Async* client).")
+
+
+async def aget_batch_responses_from_llm(
+    msg,
+    client,
+    model,
+    system_message,
+    print_debug=False,
+    msg_history=None,
+    temperature=0.75,
+    n_responses=1,
+    max_concurrency=None,
+    timeout=None,
+    cache_prefix=None,
+):
+    """
+    Async version of get_batch_responses_from_llm.
+    `timeout` (seconds) bounds the whole call; cancelling the awaiting task cancels the request.
+    """
+    if msg_history is None:
+        msg_history = []
+    spec = get_model_spec(model)
+    provider = PROVIDERS[spec.provider]
+    client = _resolve_async_client(client, model)
+    cache, cache_key = get_cache_key(
+        model, system_message, msg_history, msg, temperature, n_responses
+    )
+    cached = cache.get(cache_key) if cache is not None else None
+
+    if cached is not None:
+        content, new_msg_history = cached
+        record_call(model, cached=True)
+    elif provider.supports_n:
+        new_msg_history = msg_history + [provider.user_message(msg, cache_prefix)]
+        content = await asyncio.wait_for(
+            provider.acreate(
+                client, spec, system_message, new_msg_history, temperature, n=n_responses
+            ),
+            timeout,
         )
-        content = response.choices[0].message.content
-        new_msg_history = new_msg_history + [{"role": "assistant", "content": content}]
-    elif model in ["meta-llama/llama-3.1-405b-instruct", "llama-3-1-405b-instruct"]:
-        new_msg_history = msg_history + [{"role": "user", "content": msg}]
-        response = client.chat.completions.create(
-            model="meta-llama/llama-3.1-405b-instruct",
-            messages=[
-                {"role": "system", "content": system_message},
-                *new_msg_history,
-            ],
-            temperature=temperature,
-            max_tokens=3000,
-            n=1,
-            stop=None,
+        new_msg_history = [
+            new_msg_history + [provider.assistant_message(c)] for c in content
+        ]
+    else:
+        semaphore = asyncio.Semaphore(max_concurrency or MAX_CONCURRENT_REQUESTS)
+
+        async def bounded_request():
+            async with semaphore:
+                return await aget_response_from_llm(
+                    msg,
+                    client,
+                    model,
+                    system_message,
+                    print_debug=False,
+                    msg_history=msg_history,
+                    temperature=temperature,
+                    cache_prefix=cache_prefix,
+                )
+
+        results = await asyncio.wait_for(
+            asyncio.gather(
+                *[bounded_request() for _ in range(n_responses)],
+                return_exceptions=True,
+            ),
+            timeout,
         )
-        content = response.choices[0].message.content
-        new_msg_history = new_msg_history + [{"role": "assistant", "content": content}]
+        content, new_msg_history = collect_fan_out_results(results)
+
+    # Partially failed fan-outs are not cached.
+    if cache is not None and cached is None and len(content) == n_responses:
+        cache.set(cache_key, [content, new_msg_history])
+
+    if print_debug:
+        # Just print the first one.
+        print_llm_debug(new_msg_history[0], content)
+
+    return content, new_msg_history
+
+
+async def aget_response_from_llm(
+    msg,
+    client,
+    model,
+    system_message,
+    print_debug=False,
+    msg_history=None,
+    temperature=0.75,
+    timeout=None,
+    cache_prefix=None,
+):
+    """
+    Async version of get_response_from_llm.
+    `timeout` (seconds) bounds the whole call; cancelling the awaiting task cancels the request.
+    """
+    if msg_history is None:
+        msg_history = []
+    spec = get_model_spec(model)
+    provider = PROVIDERS[spec.provider]
+    client = _resolve_async_client(client, model)
+    cache, cache_key = get_cache_key(model, system_message, msg_history, msg, temperature)
+    cached = cache.get(cache_key) if cache is not None else None
+
+    if cached is not None:
+        content, new_msg_history = cached
+        record_call(model, cached=True)
     else:
-        raise ValueError(f"Model {model} not supported.")
+        new_msg_history = msg_history + [provider.user_message(msg, cache_prefix)]
+        content = await asyncio.wait_for(
+            provider.acreate(client, spec, system_message, new_msg_history, temperature),
+            timeout,
+        )
+        content = content[0]
+        new_msg_history = new_msg_history + [provider.assistant_message(content)]
+        if cache is not None:
+            cache.set(cache_key, [content, new_msg_history])
 
     if print_debug:
-        print()
-        print("*" * 20 + " LLM START " + "*" * 20)
-        for j, msg in enumerate(new_msg_history):
-            print(f'{j}, {msg["role"]}: {msg["content"]}')
-        print(content)
-        print("*" * 21 + " LLM END " + "*" * 21)
-        print()
+        print_llm_debug(new_msg_history, content)
 
     return content, new_msg_history
 
 
+def stream_response_from_llm(
+    msg,
+    client,
+    model,
+    system_message,
+    msg_history=None,
+    temperature=0.75,
+    cache_prefix=None,
+):
+    """
+    Streaming version of get_response_from_llm: yields text deltas as they arrive.
+    Streamed responses bypass the response cache.
+    """
+    if msg_history is None:
+        msg_history = []
+    spec = get_model_spec(model)
+    provider = PROVIDERS[spec.provider]
+    new_msg_history = msg_history + [provider.user_message(msg, cache_prefix)]
+    yield from provider.stream(client, spec, system_message, new_msg_history, temperature)
+
+
+async def astream_response_from_llm(
+    msg,
+    client,
+    model,
+    system_message,
+    msg_history=None,
+    temperature=0.75,
+    cache_prefix=None,
+):
+    """
+    Async streaming version of get_response_from_llm: yields text deltas as they arrive.
+    """
+    if msg_history is None:
+        msg_history = []
+    spec = get_model_spec(model)
+    provider = PROVIDERS[spec.provider]
+    client = _resolve_async_client(client, model)
+    new_msg_history = msg_history + [provider.user_message(msg, cache_prefix)]
+    async for delta in provider.astream(client, spec, system_message, new_msg_history, temperature):
+        yield delta
+
+
+async def astream_chat_completion(client, model, messages, **kwargs):
+    """
+    Yield text deltas of an OpenAI-compatible chat completion.
+    For callers that build their own messages and models (the bot, web/openreview summaries).
+    """
+    kwargs.setdefault("stream_options", {"include_usage": True})
+    response = await acall_with_rate_limit(
+        client.chat.completions.create, model=model, messages=messages, stream=True, **kwargs
+    )
+    async for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
 def extract_json_between_markers(llm_output):
     json_start_marker = "```json"
     json_end_marker = "```"
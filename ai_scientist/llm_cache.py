@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class LLMCache:
+    """
+    Content-addressed on-disk cache for LLM responses, backed by SQLite.
+    Entries expire after `ttl` seconds and the least recently used ones are evicted
+    once the stored values exceed `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl=30 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                expires REAL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model, system_message, messages, temperature, response_format=None, **extra):
+        """
+        Hash everything that determines the completion.
+        `response_format` may be a pydantic model class, in which case its JSON schema is used.
+        """
+        if hasattr(response_format, "model_json_schema"):
+            response_format = response_format.model_json_schema()
+        payload = {
+            "model": model,
+            "system_message": system_message,
+            "messages": messages,
+            "temperature": temperature,
+            "response_format": response_format,
+            **extra,
+        }
+        data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, expires FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] < now:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed, expires) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, len(data.encode("utf-8")), now, now, now + ttl if ttl else None),
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        self.conn.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires < ?", (now,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed ASC"):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_llm_cache = None
+
+
+def get_llm_cache():
+    """
+    Return the shared cache, or None when caching is disabled.
+    Set LLM_CACHE_PATH to enable it (LLM_CACHE_MAX_MB and LLM_CACHE_TTL tune the bounds).
+    """
+    global _llm_cache
+    path = os.environ.get("LLM_CACHE_PATH")
+    if not path:
+        return None
+    if _llm_cache is None:
+        _llm_cache = LLMCache(
+            path,
+            max_bytes=int(os.environ.get("LLM_CACHE_MAX_MB", 256)) * 1024 * 1024,
+            ttl=int(os.environ.get("LLM_CACHE_TTL", 30 * 24 * 3600)),
+        )
+    return _llm_cache
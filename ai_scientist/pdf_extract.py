@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pypdf import PdfReader
+import pymupdf
+import pymupdf4llm
+
+# Bump when the extraction logic changes so stored documents are re-parsed.
+EXTRACTOR_VERSION = "1"
+# Below this many pages the process pool costs more than it saves.
+MIN_PAGES_FOR_POOL = 16
+# A page whose best extraction scores below this is tried with the next backend.
+MIN_PAGE_QUALITY = 0.5
+MARKDOWN_SYNTAX = set("#*|-_`>")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_extract_pool():
+    """
+    Shared process pool, created on first use. Workers come from a forkserver, never
+    from forking the caller, which may hold locks on other threads (e.g. the bot's
+    event loop, rate limiter or sqlite caches).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _pool
+
+
+def _reset_extract_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def score_page_text(text):
+    """
+    Rough 0..1 quality of extracted page text: the share of alphanumeric characters
+    among non-whitespace ones, penalized for undecoded glyphs ("(cid:12)", U+FFFD).
+    Markdown syntax is ignored so markdown and plain-text extractions compare fairly.
+    """
+    chars = [c for c in text if not c.isspace() and c not in MARKDOWN_SYNTAX]
+    if not chars:
+        return 0.0
+    score = sum(c.isalnum() for c in chars) / len(chars)
+    bad = text.count("\ufffd") + text.count("(cid:")
+    return max(0.0, score - 10 * bad / len(chars))
+
+
+def _pick(page_result, backend, text, seconds):
+    score = score_page_text(text)
+    page_result["seconds"] += seconds
+    if page_result["backend"] is None or score > page_result["score"]:
+        page_result.update(text=text, backend=backend, score=score)
+
+
+def _extract_page_range(pdf_path, start, stop):
+    """Extract pages [start, stop) with one open document per backend."""
+    results = [
+        {"page": i, "text": "", "backend": None, "score": 0.0, "seconds": 0.0}
+        for i in range(start, stop)
+    ]
+    doc = pymupdf.open(pdf_path)
+    try:
+        t0 = time.perf_counter()
+        chunks = pymupdf4llm.to_markdown(doc, pages=list(range(start, stop)), page_chunks=True)
+        seconds = (time.perf_counter() - t0) / max(len(chunks), 1)
+        for result, chunk in zip(results, chunks):
+            _pick(result, "pymupdf4llm", chunk["text"], seconds)
+    except Exception as e:
+        print(f"Error with pymupdf4llm on pages {start}-{stop - 1}: {e}")
+
+    reader = None
+    for result in results:
+        if result["score"] >= MIN_PAGE_QUALITY:
+            continue
+        try:
+            t0 = time.perf_counter()
+            text = doc[result["page"]].get_text()
+            _pick(result, "pymupdf", text, time.perf_counter() - t0)
+        except Exception as e:
+            print(f"Error with pymupdf on page {result['page']}: {e}")
+        if result["score"] >= MIN_PAGE_QUALITY:
+            continue
+        try:
+            t0 = time.perf_counter()
+            if reader is None:
+                reader = PdfReader(pdf_path)
+            text = reader.pages[result["page"]].extract_text() or ""
+            _pick(result, "pypdf", text, time.perf_counter() - t0)
+        except Exception as e:
+            print(f"Error with pypdf on page {result['page']}: {e}")
+    doc.close()
+    return results
+
+
+def extract_pdf_pages(pdf_path, num_pages=None, max_workers=None):
+    """
+    Extract every page of a PDF, choosing the best-scoring backend per page
+    (pymupdf4llm markdown, then pymupdf plain text, then pypdf).
+    Long documents are split into page ranges extracted in the shared process pool.
+    Returns one dict per page: page, text, backend, score, seconds.
+    """
+    with pymupdf.open(pdf_path) as doc:
+        page_count = doc.page_count
+    if num_pages is not None:
+        page_count = min(page_count, num_pages)
+    if page_count == 0:
+        return []
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if page_count < MIN_PAGES_FOR_POOL or max_workers == 1:
+        return _extract_page_range(pdf_path, 0, page_count)
+
+    chunk_size = -(-page_count // max_workers)
+    ranges = [(i, min(i + chunk_size, page_count)) for i in range(0, page_count, chunk_size)]
+    try:
+        executor = get_extract_pool()
+        futures = [
+            executor.submit(_extract_page_range, pdf_path, start, stop)
+            for start, stop in ranges
+        ]
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+    except BrokenProcessPool as e:
+        # 워커가 죽으면 다음 문서를 위해 풀을 새로 만들고, 이 문서는 현재 프로세스에서 추출
+        print(f"PDF extraction pool broke ({e}), extracting in process")
+        _reset_extract_pool()
+        return _extract_page_range(pdf_path, 0, page_count)
+    return pages
+
+
+def extract_pdf_text(pdf_path, num_pages=None, max_workers=None, print_timing=True):
+    start = time.perf_counter()
+    pages = extract_pdf_pages(pdf_path, num_pages=num_pages, max_workers=max_workers)
+    if print_timing and pages:
+        backends = {}
+        for page in pages:
+            backends[page["backend"]] = backends.get(page["backend"], 0) + 1
+        slowest = max(pages, key=lambda p: p["seconds"])
+        print(
+            f"Extracted {len(pages)} pages from {os.path.basename(pdf_path)} in "
+            f"{time.perf_counter() - start:0.2f}s (backends: {backends}, "
+            f"slowest: page {slowest['page']} {slowest['seconds']:0.2f}s)"
+        )
+    return "\n".join(page["text"] for page in pages)
+
+
+def get_extractor_version():
+    return f"{EXTRACTOR_VERSION}-pymupdf4llm{getattr(pymupdf4llm, '__version__', '')}"
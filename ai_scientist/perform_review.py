@@ -1,14 +1,18 @@
 import os
 import numpy as np
 import json
-from pypdf import PdfReader
-import pymupdf
-import pymupdf4llm
+import contextvars
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from ai_scientist.llm import (
     get_response_from_llm,
     get_batch_responses_from_llm,
     extract_json_between_markers,
 )
+from ai_scientist.instrumentation import track_pipeline
+from ai_scientist.pdf_extract import extract_pdf_text, get_extractor_version
+from ai_scientist.doc_store import get_document_store
 
 reviewer_system_prompt_base = (
     "You are an AI researcher who is reviewing a paper that was submitted to a prestigious ML venue."
@@ -123,6 +127,21 @@ In general, authors should be rewarded rather than punished for being up front a
 )
 
 
+# Numerical fields averaged over the ensemble, with their valid ranges.
+score_limits = [
+    ("Originality", (1, 4)),
+    ("Quality", (1, 4)),
+    ("Clarity", (1, 4)),
+    ("Significance", (1, 4)),
+    ("Soundness", (1, 4)),
+    ("Presentation", (1, 4)),
+    ("Contribution", (1, 4)),
+    ("Overall", (1, 10)),
+    ("Confidence", (1, 5)),
+]
+
+
+@track_pipeline("review")
 def perform_review(
     text,
     model,
@@ -135,14 +154,18 @@ def perform_review(
     return_msg_history=False,
     reviewer_system_prompt=reviewer_system_prompt_neg,
     review_instruction_form=neurips_form,
+    parallel_reflections=False,
+    early_exit_policy="done",
 ):
-    if num_fs_examples > 0:
-        fs_prompt = get_review_fewshot_examples(num_fs_examples)
-        base_prompt = review_instruction_form + fs_prompt
-    else:
-        base_prompt = review_instruction_form
-
-    base_prompt += f"""
+    """
+    parallel_reflections: with an ensemble, let every reviewer reflect on its own review
+    concurrently before the meta-review, instead of reflecting once on the aggregate.
+    early_exit_policy: see reflect_review.
+    """
+    # The prefix is memoized so it is byte-identical across reviews and can be served
+    # from the provider's prompt cache.
+    prompt_prefix = get_review_prompt_prefix(num_fs_examples, review_instruction_form)
+    base_prompt = prompt_prefix + f"""
 Here is the paper you are asked to review:
 ```
 {text}
@@ -159,14 +182,45 @@ Here is the paper you are asked to review:
             # Higher temperature to encourage diversity.
             temperature=0.75,
             n_responses=num_reviews_ensemble,
+            cache_prefix=prompt_prefix,
         )
-        parsed_reviews = []
-        for idx, rev in enumerate(llm_review):
+        parsed_reviews, parsed_histories = [], []
+        for idx, (rev, hist) in enumerate(zip(llm_review, msg_histories)):
             try:
-                parsed_reviews.append(extract_json_between_markers(rev))
+                parsed = extract_json_between_markers(rev)
             except Exception as e:
                 print(f"Ensemble review {idx} failed: {e}")
-        parsed_reviews = [r for r in parsed_reviews if r is not None]
+                continue
+            if parsed is not None:
+                parsed_reviews.append(parsed)
+                parsed_histories.append(hist)
+        if not parsed_reviews:
+            raise ValueError(f"No valid ensemble reviews among {len(llm_review)} responses.")
+
+        if parallel_reflections and num_reflections > 1:
+            with ThreadPoolExecutor(max_workers=len(parsed_reviews)) as executor:
+                futures = [
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        reflect_review,
+                        r,
+                        hist,
+                        model,
+                        client,
+                        num_reflections,
+                        temperature,
+                        reviewer_system_prompt,
+                        early_exit_policy,
+                    )
+                    for r, hist in zip(parsed_reviews, parsed_histories)
+                ]
+                for idx, future in enumerate(futures):
+                    try:
+                        parsed_reviews[idx] = future.result()[0]
+                    except Exception as e:
+                        # Keep the unreflected review of this reviewer.
+                        print(f"Reflection of ensemble review {idx} failed: {e}")
+
         review = get_meta_review(model, client, temperature, parsed_reviews)
 
         # take first valid in case meta-reviewer fails
@@ -174,17 +228,7 @@ Here is the paper you are asked to review:
             review = parsed_reviews[0]
 
         # Replace numerical scores with the average of the ensemble.
-        for score, limits in [
-            ("Originality", (1, 4)),
-            ("Quality", (1, 4)),
-            ("Clarity", (1, 4)),
-            ("Significance", (1, 4)),
-            ("Soundness", (1, 4)),
-            ("Presentation", (1, 4)),
-            ("Contribution", (1, 4)),
-            ("Overall", (1, 10)),
-            ("Confidence", (1, 5)),
-        ]:
+        for score, limits in score_limits:
             scores = []
             for r in parsed_reviews:
                 if score in r and limits[1] >= r[score] >= limits[0]:
@@ -216,26 +260,23 @@ REVIEW JSON:
             print_debug=False,
             msg_history=msg_history,
             temperature=temperature,
+            cache_prefix=prompt_prefix,
         )
         review = extract_json_between_markers(llm_review)
 
-    if num_reflections > 1:
-        for j in range(num_reflections - 1):
-            # print(f"Relection: {j + 2}/{num_reflections}")
-            text, msg_history = get_response_from_llm(
-                reviewer_reflection_prompt,
-                client=client,
-                model=model,
-                system_message=reviewer_system_prompt,
-                msg_history=msg_history,
-                temperature=temperature,
-            )
-            review = extract_json_between_markers(text)
-            assert review is not None, "Failed to extract JSON from LLM output"
-
-            if "I am done" in text:
-                # print(f"Review generation converged after {j + 2} iterations.")
-                break
+    # In parallel mode the ensemble members have already reflected.
+    already_reflected = parallel_reflections and num_reviews_ensemble > 1
+    if num_reflections > 1 and not already_reflected:
+        review, msg_history = reflect_review(
+            review,
+            msg_history,
+            model,
+            client,
+            num_reflections,
+            temperature,
+            reviewer_system_prompt,
+            early_exit_policy,
+        )
 
     if return_msg_history:
         return review, msg_history
@@ -243,6 +284,53 @@ REVIEW JSON:
         return review
 
 
+def get_review_scores(review):
+    scores = {score: review.get(score) for score, _ in score_limits}
+    scores["Decision"] = review.get("Decision")
+    return scores
+
+
+def reflect_review(
+    review,
+    msg_history,
+    model,
+    client,
+    num_reflections,
+    temperature,
+    reviewer_system_prompt=reviewer_system_prompt_neg,
+    early_exit_policy="done",
+):
+    """
+    Run up to `num_reflections - 1` reflection rounds over one review's message history.
+    early_exit_policy: "done" stops when the model says "I am done", "unchanged" also
+    stops as soon as the scores are identical between rounds, None runs every round.
+    """
+    for j in range(num_reflections - 1):
+        # print(f"Relection: {j + 2}/{num_reflections}")
+        text, msg_history = get_response_from_llm(
+            reviewer_reflection_prompt.format(
+                current_round=j + 2, num_reflections=num_reflections
+            ),
+            client=client,
+            model=model,
+            system_message=reviewer_system_prompt,
+            msg_history=msg_history,
+            temperature=temperature,
+        )
+        new_review = extract_json_between_markers(text)
+        assert new_review is not None, "Failed to extract JSON from LLM output"
+        unchanged = get_review_scores(new_review) == get_review_scores(review)
+        review = new_review
+
+        if early_exit_policy is not None and "I am done" in text:
+            # print(f"Review generation converged after {j + 2} iterations.")
+            break
+        if early_exit_policy == "unchanged" and unchanged:
+            break
+
+    return review, msg_history
+
+
 reviewer_reflection_prompt = """Round {current_round}/{num_reflections}.
 In your thoughts, first carefully consider the accuracy and soundness of the review you just created.
 Include any other factors that you think are important in evaluating the paper.
@@ -265,36 +353,16 @@ ONLY INCLUDE "I am done" IF YOU ARE MAKING NO MORE CHANGES."""
 
 
 def load_paper(pdf_path, num_pages=None, min_size=100):
-    try:
-        if num_pages is None:
-            text = pymupdf4llm.to_markdown(pdf_path)
-        else:
-            reader = PdfReader(pdf_path)
-            min_pages = min(len(reader.pages), num_pages)
-            text = pymupdf4llm.to_markdown(pdf_path, pages=list(range(min_pages)))
-        if len(text) < min_size:
-            raise Exception("Text too short")
-    except Exception as e:
-        print(f"Error with pymupdf4llm, falling back to pymupdf: {e}")
-        try:
-            doc = pymupdf.open(pdf_path)  # open a document
-            if num_pages:
-                doc = doc[:num_pages]
-            text = ""
-            for page in doc:  # iterate the document pages
-                text = text + page.get_text()  # get plain text encoded as UTF-8
-            if len(text) < min_size:
-                raise Exception("Text too short")
-        except Exception as e:
-            print(f"Error with pymupdf, falling back to pypdf: {e}")
-            reader = PdfReader(pdf_path)
-            if num_pages is None:
-                text = "".join(page.extract_text() for page in reader.pages)
-            else:
-                text = "".join(page.extract_text() for page in reader.pages[:num_pages])
-            if len(text) < min_size:
-                raise Exception("Text too short")
-
+    parser = "pdf_extract" if num_pages is None else f"pdf_extract-{num_pages}pages"
+    document = get_document_store().get_or_parse(
+        pdf_path,
+        parser,
+        get_extractor_version(),
+        lambda path: {"text": extract_pdf_text(path, num_pages=num_pages)},
+    )
+    text = document["text"]
+    if len(text) < min_size:
+        raise Exception("Text too short")
     return text
 
 
@@ -320,7 +388,53 @@ fewshot_reviews = [
 ]
 
 
+def load_fewshot_paper(pdf_path):
+    """
+    Return the text of a few-shot paper from its .txt sidecar.
+    The sidecar is regenerated with load_paper only when the PDF's mtime and content hash
+    no longer match what was recorded in `<paper>.txt.meta.json`.
+    """
+    txt_path = pdf_path.replace(".pdf", ".txt")
+    meta_path = txt_path + ".meta.json"
+    if not os.path.exists(pdf_path):
+        with open(txt_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    mtime = os.path.getmtime(pdf_path)
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+    sha256 = None
+    if meta is None or meta["mtime"] != mtime:
+        with open(pdf_path, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    if not os.path.exists(txt_path):
+        fresh = False
+    elif meta is None:
+        # A sidecar without metadata was provided by hand; adopt it for the current PDF.
+        fresh = True
+    else:
+        fresh = meta["mtime"] == mtime or meta["sha256"] == sha256
+
+    if fresh:
+        with open(txt_path, "r", encoding="utf-8") as f:
+            paper_text = f.read()
+    else:
+        paper_text = load_paper(pdf_path)
+        with open(txt_path, "w", encoding="utf-8") as f:
+            f.write(paper_text)
+
+    if sha256 is not None:
+        with open(meta_path, "w") as f:
+            json.dump({"mtime": mtime, "sha256": sha256}, f)
+    return paper_text
+
+
+@functools.lru_cache(maxsize=None)
 def get_review_fewshot_examples(num_fs_examples=1):
+    # Built once per process; the examples always appear in the fixed fewshot_papers order.
     fewshot_prompt = """
 Below are some sample reviews, copied from previous machine learning conferences.
 Note that while each review is formatted differently according to each reviewer's style, the reviews are well-structured and therefore easy to navigate.
@@ -328,12 +442,7 @@ Note that while each review is formatted differently according to each reviewer'
     for paper, review in zip(
         fewshot_papers[:num_fs_examples], fewshot_reviews[:num_fs_examples]
     ):
-        txt_path = paper.replace(".pdf", ".txt")
-        if os.path.exists(txt_path):
-            with open(txt_path, "r", encoding="utf-8") as f:
-                paper_text = f.read()
-        else:
-            paper_text = load_paper(paper)
+        paper_text = load_fewshot_paper(paper)
         review_text = load_review(review)
         fewshot_prompt += f"""
 Paper:
@@ -352,6 +461,14 @@ Review:
     return fewshot_prompt
 
 
+@functools.lru_cache(maxsize=None)
+def get_review_prompt_prefix(num_fs_examples=1, review_instruction_form=neurips_form):
+    """The static part of the review prompt that precedes the paper text."""
+    if num_fs_examples > 0:
+        return review_instruction_form + get_review_fewshot_examples(num_fs_examples)
+    return review_instruction_form
+
+
 meta_reviewer_system_prompt = """You are an Area Chair at a machine learning conference.
 You are in charge of meta-reviewing a paper that was reviewed by {reviewer_count} reviewers.
 Your job is to aggregate the reviews into a single meta-review in the same format.
@@ -378,6 +495,7 @@ Review {i + 1}/{len(reviews)}:
         print_debug=False,
         msg_history=None,
         temperature=temperature,
+        cache_prefix=neurips_form,
     )
     meta_review = extract_json_between_markers(llm_review)
     return meta_review
@@ -404,6 +522,8 @@ def perform_review_from_pdf(
     num_fs_examples=1,
     num_reviews_ensemble=1,
     temperature=0.75,
+    parallel_reflections=False,
+    early_exit_policy="done",
 ):
     """
     Perform a review from a PDF file.
@@ -417,6 +537,8 @@ def perform_review_from_pdf(
         num_fs_examples=num_fs_examples,
         num_reviews_ensemble=num_reviews_ensemble,
         temperature=temperature,
+        parallel_reflections=parallel_reflections,
+        early_exit_policy=early_exit_policy,
     )
     review_markdown = ""
 
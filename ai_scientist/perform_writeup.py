@@ -8,6 +8,7 @@ from ai_scientist.generate_ideas import search_for_papers
 from ai_scientist.llm import get_response_from_llm, extract_json_between_markers
 import re
 import json
+from ai_scientist.instrumentation import track_pipeline
 
 
 # GENERATE LATEX
@@ -396,6 +397,7 @@ Ensure the citation is well-integrated into the text.'''
 
 
 # PERFORM WRITEUP
+@track_pipeline("writeup")
 def perform_writeup(
     idea, folder_name, coder, cite_client, cite_model, num_cite_rounds=20
 ):
@@ -0,0 +1,329 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from ai_scientist.instrumentation import record_call
+
+# (requests/min, tokens/min) per provider. Per-model overrides can be set with
+# set_rate_limit() or LLM_RATE_LIMITS, e.g. "openai=500/800000,anthropic:claude-3-5-sonnet-20240620=50/40000".
+DEFAULT_RATE_LIMITS = {
+    "openai": (500, 800000),
+    "anthropic": (50, 80000),
+    "deepseek": (60, 1000000),
+    "openrouter": (200, 1000000),
+}
+FALLBACK_RATE_LIMIT = (60, 200000)
+
+MAX_RETRIES = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+RETRYABLE_ERRORS = (
+    "RateLimitError",
+    "APITimeoutError",
+    "APIConnectionError",
+    "InternalServerError",
+    "ServiceUnavailableError",
+    "Timeout",
+)
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute, up to one minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """
+        Take `amount` units (the balance may go negative) and return how long
+        the caller has to wait before the reservation is covered.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # A single request larger than the bucket only waits for a full bucket.
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets for one (provider, model) pair."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.metrics = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "throttle_seconds": 0.0,
+            "backoff_seconds": 0.0,
+        }
+
+    def reserve(self, estimated_tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        self.metrics["requests"] += 1
+        self.metrics["throttle_seconds"] += wait
+        return wait
+
+    def settle(self, estimated_tokens, response):
+        # Give back (or take) the difference between the estimate and the reported usage.
+        used = get_used_tokens(response)
+        if used is not None:
+            self.tokens.refund(estimated_tokens - used)
+
+
+_limiters = {}
+_overrides = {}
+_limiters_lock = threading.Lock()
+
+
+def _load_env_overrides():
+    for item in os.environ.get("LLM_RATE_LIMITS", "").split(","):
+        if "=" not in item:
+            continue
+        key, limits = item.strip().split("=", 1)
+        provider, _, model = key.partition(":")
+        rpm, tpm = limits.split("/")
+        _overrides[(provider, model or None)] = (int(rpm), int(tpm))
+
+
+_load_env_overrides()
+
+
+def set_rate_limit(provider, requests_per_minute, tokens_per_minute, model=None):
+    with _limiters_lock:
+        _overrides[(provider, model)] = (requests_per_minute, tokens_per_minute)
+        for key in list(_limiters):
+            if key[0] == provider and (model is None or key[1] == model):
+                del _limiters[key]
+
+
+def get_rate_limiter(provider, model):
+    key = (provider, model)
+    with _limiters_lock:
+        if key not in _limiters:
+            limits = (
+                _overrides.get(key)
+                or _overrides.get((provider, None))
+                or DEFAULT_RATE_LIMITS.get(provider, FALLBACK_RATE_LIMIT)
+            )
+            _limiters[key] = RateLimiter(*limits)
+        return _limiters[key]
+
+
+def get_rate_limit_metrics():
+    with _limiters_lock:
+        return {f"{p}/{m}": dict(limiter.metrics) for (p, m), limiter in _limiters.items()}
+
+
+def guess_provider(model):
+    # litellm style "openrouter/perplexity/sonar-pro" names carry their provider.
+    if "/" in model:
+        return model.split("/")[0]
+    if "claude" in model:
+        return "anthropic"
+    if "deepseek" in model:
+        return "deepseek"
+    return "openai"
+
+
+def estimate_request_tokens(kwargs):
+    # ~4 characters per token for the prompt, plus the completion budget.
+    chars = len(str(kwargs.get("system", "")))
+    for message in kwargs.get("messages") or []:
+        chars += len(str(message.get("content", ""))) if isinstance(message, dict) else len(str(message))
+    completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or 1000
+    return chars // 4 + completion * kwargs.get("n", 1)
+
+
+def get_used_tokens(response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    total = getattr(usage, "total_tokens", None)
+    if total is None and getattr(usage, "input_tokens", None) is not None:
+        total = usage.input_tokens + usage.output_tokens
+    return total
+
+
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 408 or status == 409 or status == 429 or status >= 500
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def get_retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # HTTP-date Retry-After values fall back to exponential backoff.
+        pass
+    return None
+
+
+def get_backoff_delay(attempt, error):
+    delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2**attempt))
+    retry_after = get_retry_after(error)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def call_with_rate_limit(fn, provider=None, max_retries=MAX_RETRIES, **kwargs):
+    """
+    Call `fn(**kwargs)` (an LLM API call taking `model=` and `messages=`) under the
+    process-wide rate limiter, retrying throttled / transient failures with jittered
+    exponential backoff that honors Retry-After.
+    """
+    model = kwargs.get("model", "")
+    limiter = get_rate_limiter(provider or guess_provider(model), model)
+    estimated_tokens = estimate_request_tokens(kwargs)
+    for attempt in range(max_retries + 1):
+        wait = limiter.reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+        start = time.perf_counter()
+        try:
+            response = fn(**kwargs)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                limiter.metrics["failures"] += 1
+                raise
+            delay = get_backoff_delay(attempt, e)
+            limiter.metrics["retries"] += 1
+            limiter.metrics["backoff_seconds"] += delay
+            print(f"Retrying {model} in {delay:0.1f} seconds after {type(e).__name__} (attempt {attempt + 1})")
+            time.sleep(delay)
+            continue
+        if kwargs.get("stream"):
+            return RecordedStream(response, model, limiter, estimated_tokens, start)
+        limiter.settle(estimated_tokens, response)
+        record_call(model, response, latency=time.perf_counter() - start)
+        return response
+
+
+async def acall_with_rate_limit(fn, provider=None, max_retries=MAX_RETRIES, **kwargs):
+    """
+    Async version of call_with_rate_limit; `fn(**kwargs)` must return an awaitable.
+    """
+    model = kwargs.get("model", "")
+    limiter = get_rate_limiter(provider or guess_provider(model), model)
+    estimated_tokens = estimate_request_tokens(kwargs)
+    for attempt in range(max_retries + 1):
+        wait = limiter.reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        start = time.perf_counter()
+        try:
+            response = await fn(**kwargs)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                limiter.metrics["failures"] += 1
+                raise
+            delay = get_backoff_delay(attempt, e)
+            limiter.metrics["retries"] += 1
+            limiter.metrics["backoff_seconds"] += delay
+            print(f"Retrying {model} in {delay:0.1f} seconds after {type(e).__name__} (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+            continue
+        if kwargs.get("stream"):
+            return RecordedStream(response, model, limiter, estimated_tokens, start)
+        limiter.settle(estimated_tokens, response)
+        record_call(model, response, latency=time.perf_counter() - start)
+        return response
+
+
+class RecordedStream:
+    """
+    A streamed response that records the call once iteration ends: tokens from the
+    chunk carrying `usage` (OpenAI-compatible APIs send it last when called with
+    stream_options={"include_usage": True}), latency up to the end of the stream.
+    Other attributes are passed through to the wrapped stream.
+    """
+
+    def __init__(self, response, model, limiter, estimated_tokens, start):
+        self.response = response
+        self.model = model
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self.start = start
+        self.final = None
+        self.recorded = False
+
+    def _see(self, chunk):
+        if getattr(chunk, "usage", None) is not None:
+            self.final = chunk
+
+    def finish(self, final=None):
+        if self.recorded:
+            return
+        self.recorded = True
+        final = final if final is not None else self.final
+        if final is not None:
+            self.limiter.settle(self.estimated_tokens, final)
+        record_call(self.model, final, latency=time.perf_counter() - self.start, stream=True)
+
+    def __iter__(self):
+        try:
+            for chunk in self.response:
+                self._see(chunk)
+                yield chunk
+        finally:
+            self.finish()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.response:
+                self._see(chunk)
+                yield chunk
+        finally:
+            self.finish()
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+
+def wait_for_rate_limit(provider=None, **kwargs):
+    """
+    Reserve capacity without retries, for calls whose errors surface mid-stream
+    (e.g. Anthropic's messages.stream). Returns a RecordedStream-like recorder:
+    call `.finish(final_message)` when the stream ends.
+    """
+    model = kwargs.get("model", "")
+    limiter = get_rate_limiter(provider or guess_provider(model), model)
+    estimated_tokens = estimate_request_tokens(kwargs)
+    wait = limiter.reserve(estimated_tokens)
+    if wait > 0:
+        time.sleep(wait)
+    return RecordedStream(None, model, limiter, estimated_tokens, time.perf_counter())
+
+
+async def await_rate_limit(provider=None, **kwargs):
+    model = kwargs.get("model", "")
+    limiter = get_rate_limiter(provider or guess_provider(model), model)
+    estimated_tokens = estimate_request_tokens(kwargs)
+    wait = limiter.reserve(estimated_tokens)
+    if wait > 0:
+        await asyncio.sleep(wait)
+    return RecordedStream(None, model, limiter, estimated_tokens, time.perf_counter())
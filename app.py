@@ -1,11 +1,61 @@
-from flask import Flask, render_template, abort, request
-import markdown
+from flask import Flask, render_template, abort, request, make_response
 import os
+import html
+import hashlib
+import threading
+import time
 from ai_reviewer.firebase_utils import FirebaseManager
+from ai_reviewer.render import render_review_html
 
 app = Flask(__name__, static_folder='static', template_folder='templates', static_url_path='/static')
 firebase_manager = FirebaseManager()
 
+
+class TTLCache:
+    def __init__(self, ttl, max_items=1000):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None or item[1] < time.time():
+                return None
+            return item[0]
+
+    def set(self, key, value):
+        with self.lock:
+            if len(self.items) >= self.max_items:
+                self.items.clear()
+            self.items[key] = (value, time.time() + self.ttl)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def pop(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+
+# 리뷰는 작성 후 바뀌지 않으므로 변환된 HTML은 오래 캐시, 목록은 다른 프로세스(봇)의 추가가
+# 곧 보이도록 짧게 캐시. 같은 프로세스의 add_paper / delete_review는 바로 무효화.
+rendered_papers = TTLCache(ttl=3600)
+index_pages = TTLCache(ttl=30)
+
+
+def invalidate_caches(paper_id):
+    index_pages.clear()
+    if paper_id is not None:
+        rendered_papers.pop(paper_id)
+
+
+firebase_manager.add_change_listener(invalidate_caches)
+# 봇이 저장/삭제한 논문을 검색 인덱스에 반영 (요청 스레드에서는 Firestore를 읽지 않음)
+firebase_manager.search_index.start_background_sync(firebase_manager)
+
 @app.route('/')
 def hello():
     prev = request.args.get('prev', default="", type=str)
@@ -15,77 +65,93 @@ def hello():
 
     search_query = request.args.get('search', default="", type=str)
 
-    items = firebase_manager.paginate(limit=10, last_doc_id=after)
-    current = items[0].id if items else None
-    after = items[-1].id if items and len(items) == 10 else None
+    # after / prev는 (review_time, id) 커서, 검색 중에는 결과 offset
+    page = index_pages.get((after, search_query))
+    if page is None:
+        if search_query:
+            # 검색 결과는 로컬 전문 검색 인덱스에서 (커서는 결과 offset)
+            page = firebase_manager.search_cards(search_query, limit=10, cursor=after or None)
+        else:
+            page = firebase_manager.paginate_cards(limit=10, cursor=after or None)
+        index_pages.set((after, search_query), page)
+    items, next_cursor = page
+    items = [item.model_copy() for item in items]
+    current = after
+    after = next_cursor
     if items:
         for item in items:
             item.review_time = item.review_time.strftime("%Y-%m-%d %H:%M")
 
     return render_template('index.html', posts=items, prev=prev, after=after, current=current, search_query=search_query)
 
-DOC_FORMAT = """
-- Authors: {authors}
-- URL: [{url}]({url})
+def replace_image_links(content, image_urls):
+    # 변환된 HTML의 src/href 속성에 있는 이미지 이름을 서명 URL로 교체
+    for image, image_url in image_urls.items():
+        content = content.replace(f'"{image}"', f'"{html.escape(image_url)}"')
 
-## TL;DR
-{tldr}
-
-## AI Review
-{markdown}
-""".strip()
+    return content
 
-def replace_image_links(content, paper_id, images):
-    for image in images:
-        image_name = f"({image})"
 
-        if image_name in content:
-            image_url = firebase_manager.get_image_download_url(paper_id, image)
-            replace_url = f"({image_url})"
-            content = content.replace(image_name, replace_url)
+def render_paper(paper_id):
+    """Firestore 조회와 Markdown 변환 결과 (이미지는 서명 전 이름 그대로), 없으면 None."""
+    rendered = rendered_papers.get(paper_id)
+    if rendered is not None:
+        return rendered
 
-    return content
+    doc = firebase_manager.get_by_id(paper_id)
+    if doc is None:
+        return None
+    # 저장 시 미리 렌더링된 HTML 사용 (backfill 전의 문서만 여기서 변환)
+    html_content = doc.rendered_html or render_review_html(doc)
+    rendered = {
+        "content": html_content,
+        "content_images": [image for image in doc.image_files if f'"{image}"' in html_content],
+        "first_image": doc.image_files[0] if doc.image_files else None,
+        "title": doc.title,
+        "author": doc.authors,
+        "description": doc.tldr,
+        "review_time": doc.review_time,
+    }
+    rendered_papers.set(paper_id, rendered)
+    return rendered
 
 
 def load_paper(paper_id):
-    try:
-        doc = firebase_manager.get_by_id(paper_id)
-        content = DOC_FORMAT.format(
-            title=doc.title,
-            tldr=doc.tldr,
-            url=doc.url,
-            authors=doc.authors,
-            markdown=doc.review
-        )
-        content = replace_image_links(content, paper_id, doc.image_files)
-        # Markdown을 HTML로 변환
-        html_content = markdown.markdown(
-            content.replace("\\n", "\n"),
-            extensions=['meta', 'fenced_code', 'tables']
-        )
-        first_image = doc.image_files[0] if doc.image_files else None
-        if first_image:
-            first_image_url = firebase_manager.get_image_download_url(paper_id, first_image)
-        else:
-            first_image_url = None
-            
-        return {
-            "content": html_content,
-            "title": doc.title,
-            "author": doc.authors,
-            "description": doc.tldr,
-            "review_time": doc.review_time.strftime("%Y-%m-%d %H:%M"),
-            "first_image": first_image_url
-        }
-    except FileNotFoundError:
+    rendered = render_paper(paper_id)
+    if rendered is None:
         return None
 
+    # 본문에 쓰인 이미지와 대표 이미지만 한 번에 서명 (서명 URL은 캐시됨)
+    first_image = rendered["first_image"]
+    image_urls = firebase_manager.get_image_download_urls(
+        paper_id, rendered["content_images"] + ([first_image] if first_image else [])
+    )
+    html_content = replace_image_links(
+        rendered["content"], {image: image_urls[image] for image in rendered["content_images"]}
+    )
+    return {
+        "content": html_content,
+        "title": rendered["title"],
+        "author": rendered["author"],
+        "description": rendered["description"],
+        "review_time": rendered["review_time"].strftime("%Y-%m-%d %H:%M"),
+        "first_image": image_urls[first_image] if first_image else None,
+        "last_modified": rendered["review_time"],
+    }
+
 @app.route('/review/<paper_id>')
 def review_paper(paper_id):
     content = load_paper(paper_id)
     if content is None:
         abort(404)
-    return render_template('paper_test.html', **content)
+    last_modified = content.pop("last_modified")
+    response = make_response(render_template('paper_test.html', **content))
+    # 서명 URL이 바뀌면 ETag도 바뀜
+    response.set_etag(hashlib.md5(response.get_data()).hexdigest())
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 if __name__ == '__main__':
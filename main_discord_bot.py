@@ -3,18 +3,24 @@ from discord.ext import commands
 import asyncio
 import traceback
 import sys
-import aiohttp
 import openai
 import schedule
-from pdfchat import download_pdf, extract_text_from_pdf, get_vector_store, setup_conversational_chain
-from web_summ import summarize_website
-from openreview_summ import get_openreview_summarization
+from pdfchat import extract_text_from_pdf, get_vector_store, setup_conversational_chain
+from web_summ import stream_summarize_website
+from openreview_summ import stream_openreview_summarization
 import logging
 import ajou_portal
 import os
 from ai_reviewer.firebase_utils import FirebaseManager
 from ai_reviewer.review import review_pdf
+from ai_reviewer.paper_key import canonical_paper_key
+from ai_reviewer.digest import make_paper_digest
 from ai_scientist.perform_review import perform_review_from_pdf
+from ai_scientist.llm import get_async_client, astream_chat_completion
+from ai_scientist.llm_cache import get_llm_cache
+from ai_scientist.rate_limit import acall_with_rate_limit
+from ai_scientist.instrumentation import record_call, set_command, start_metrics_server
+from ai_scientist.downloader import adownload_pdf, adownload_file
 from pptgen import create_presentation_from_report
 from deepresearch import get_deep_research
 import litellm
@@ -34,27 +40,71 @@ intents.members = True
 intents.guilds = True
 
 client = openai.OpenAI()
+# 이벤트 루프를 막지 않도록 커맨드 핸들러에서는 풀링된 async 클라이언트를 사용
+aclient = get_async_client("openai")
 
 bot = commands.Bot(command_prefix='!', intents=intents)
 manager = FirebaseManager()
 
+# METRICS_PORT를 설정하면 http://<host>:<port>/metrics 에서 LLM 토큰/비용/지연 시간을 노출
+if os.environ.get("METRICS_PORT"):
+    start_metrics_server(int(os.environ["METRICS_PORT"]))
+
+@bot.before_invoke
+async def label_command(ctx):
+    # 이 커맨드에서 발생하는 모든 LLM 호출을 커맨드 이름으로 집계
+    set_command(ctx.command.qualified_name)
+
 async def send_long_message(ctx, message):
     chunks = [message[i:i+1900] for i in range(0, len(message), 1900)]
     for chunk in chunks:
         await ctx.send(chunk)
 
+async def send_streaming_message(ctx, stream, edit_interval=1.0):
+    """
+    스트리밍 응답을 받는 대로 디스코드 메시지에 반영합니다.
+    첫 토큰이 오면 바로 메시지를 보내고, 이후에는 edit_interval초 간격으로 수정하며 1900자를 넘으면 새 메시지로 넘어갑니다.
+    전체 응답 텍스트를 반환합니다.
+    """
+    loop = asyncio.get_running_loop()
+    full_text = []
+    buffer = ""
+    message = None
+    last_edit = 0.0
+
+    async def flush(text):
+        nonlocal message
+        if not text.strip():
+            return
+        if message is None:
+            message = await ctx.send(text)
+        else:
+            await message.edit(content=text)
+
+    async for delta in stream:
+        full_text.append(delta)
+        buffer += delta
+        while len(buffer) > 1900:
+            # 현재 메시지를 1900자로 확정하고 나머지는 다음 메시지로
+            await flush(buffer[:1900])
+            buffer = buffer[1900:]
+            message = None
+            last_edit = 0.0
+        if loop.time() - last_edit >= edit_interval:
+            await flush(buffer)
+            last_edit = loop.time()
+
+    await flush(buffer)
+    return "".join(full_text)
+
 async def download_file(ctx, url, filename):
-    # 파일 다운로드
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status == 200:
-                pdf_data = await resp.read()
-                with open(filename, 'wb') as f:
-                    f.write(pdf_data)
-                
-                await ctx.send(f'{filename} 다운로드 완료!')
-            else:
-                await ctx.send('파일 다운로드 실패')
+    # 파일 다운로드 (공유 세션, 스트리밍, 크기 제한)
+    try:
+        await adownload_file(url, filename, filename + ".meta.json")
+        await ctx.send(f'{filename} 다운로드 완료!')
+    except Exception as e:
+        print(f"Error downloading {url}: {e}")
+        await ctx.send('파일 다운로드 실패')
 
 @bot.command()
 async def status(ctx):
@@ -109,8 +159,18 @@ async def on_command_error(ctx, error):
         # await dev_user.send(f"An error occurred in command {ctx.command}:\n```{error_msg}```")
 
 
-async def get_openai_response(prompt, model="gpt-4.1-mini", system_prompt="You are a helpful AI assistant specializing in answering questions."):
-    response = client.chat.completions.create(
+async def get_openai_response(prompt, model="gpt-4.1-mini", system_prompt="You are a helpful AI assistant specializing in answering questions.", use_cache=False):
+    # use_cache: 같은 입력에 같은 답을 돌려줘도 되는 경우(논문 요약 등)에만 켜기
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        cache_key = cache.make_key(model, system_prompt, [{"role": "user", "content": prompt}], None, max_tokens=16384)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            record_call(model, cached=True)
+            return cached
+
+    response = await acall_with_rate_limit(
+        aclient.chat.completions.create,
         model=model,
         messages=[
             {"role": "system", "content": system_prompt},
@@ -118,7 +178,36 @@ async def get_openai_response(prompt, model="gpt-4.1-mini", system_prompt="You a
         ],
         max_tokens=16384,
     )
-    return response.choices[0].message.content
+    content = response.choices[0].message.content
+    if cache is not None:
+        cache.set(cache_key, content)
+    return content
+
+async def stream_openai_response(prompt, model="gpt-4.1-mini", system_prompt="You are a helpful AI assistant specializing in answering questions.", use_cache=False):
+    # get_openai_response의 스트리밍 버전, 캐시 히트면 전체 응답을 한 번에 yield
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        cache_key = cache.make_key(model, system_prompt, [{"role": "user", "content": prompt}], None, max_tokens=16384)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            record_call(model, cached=True)
+            yield cached
+            return
+
+    chunks = []
+    async for delta in astream_chat_completion(
+        aclient,
+        model,
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=16384,
+    ):
+        chunks.append(delta)
+        yield delta
+    if cache is not None:
+        cache.set(cache_key, "".join(chunks))
 
 ALLOWED_MODELS = ["gpt-4.1", "gpt-4.1-mini", "o4-mini"]
 
@@ -144,9 +233,12 @@ async def paper(ctx, input: str = None, model: str = "gpt-4.1"):
         await ctx.send("논문을 분석 중입니다. 잠시만 기다려주세요...")
 
         # PDF 다운로드 및 텍스트 추출 (기존 함수 사용)
-        pdf_path = download_pdf(url)
+        # 첨부파일은 디스코드 CDN URL로 받음 (같은 내용이면 문서 저장소에서 재사용)
+        pdf_path = await adownload_pdf(url or attachment.url)
         print(pdf_path)
         pdf_text = await extract_text_from_pdf(pdf_path)
+        # 40,000자를 넘는 논문은 잘라내는 대신 섹션별로 요약해서 사용
+        pdf_text = await asyncio.to_thread(make_paper_digest, client, pdf_text)
 
         # GPT를 사용하여 논문 분석
         analysis_prompt = f"""
@@ -164,17 +256,15 @@ async def paper(ctx, input: str = None, model: str = "gpt-4.1"):
 {pdf_text[:40000]}
         """.strip()
 
-        analysis = await get_openai_response(
+        # 분석 결과를 생성되는 대로 여러 메시지로 나누어 보내기
+        analysis = await send_streaming_message(ctx, stream_openai_response(
             analysis_prompt, 
             model,
-            system_prompt="You are a helpful AI assistant specializing in summarizing research papers."
-            )
+            system_prompt="You are a helpful AI assistant specializing in summarizing research papers.",
+            use_cache=True
+            ))
 
         print(analysis)
-        # 분석 결과를 여러 메시지로 나누어 보내기
-        chunks = [analysis[i:i+1900] for i in range(0, len(analysis), 1900)]
-        for chunk in chunks:
-            await ctx.send(chunk)
 
     except Exception as e:
         await ctx.send(f"논문 분석 중 오류가 발생했습니다: {str(e)}")
@@ -203,13 +293,14 @@ active_reviews = {}
 async def review(ctx, url: str):
     await ctx.message.add_reaction("👀")
 
-    # 이미 진행 중인 리뷰가 있는지 확인
-    if url in active_reviews:
+    # 이미 진행 중인 리뷰가 있는지 확인 (abs/pdf 링크 등 같은 논문은 같은 키)
+    paper_key = canonical_paper_key(url)
+    if paper_key in active_reviews:
         await ctx.send("이미 해당 논문은 리뷰를 진행중입니다. 완료될 때까지 기다려주세요.")
         return
     
     # 현재 작업 추적
-    active_reviews[url] = True
+    active_reviews[paper_key] = True
     
     try:
         # 비동기로 리뷰 작업 실행
@@ -223,7 +314,7 @@ async def review(ctx, url: str):
     
     finally:
         # 작업 완료 후 진행 중 표시 제거
-        del active_reviews[url]
+        del active_reviews[paper_key]
         # 눈 이모지 제거
         await ctx.message.remove_reaction("👀", bot.user)
 
@@ -293,13 +384,17 @@ async def pro_review(ctx):
     # perform_review_from_pdf 함수 호출 (비동기/동기 여부에 따라 다름)
     # 예시: 결과를 받아서 메시지로 전송
     try:
-        result, _ = perform_review_from_pdf(
+        result, _ = await asyncio.to_thread(
+            perform_review_from_pdf,
             save_path,
             model="gpt-4.1",
             client=client,
             num_reflections=5,
             num_fs_examples=1,
-            num_reviews_ensemble=5
+            num_reviews_ensemble=5,
+            # 리뷰어별로 동시에 reflection, 점수가 더 이상 바뀌지 않으면 조기 종료
+            parallel_reflections=True,
+            early_exit_policy="unchanged",
             )
         await send_long_message(ctx, result)
     except Exception as e:
@@ -338,7 +433,8 @@ async def search(ctx, *, question: str):
 
     try:
         # 비동기로 리뷰 작업 실행
-        output = await litellm.acompletion(
+        output = await acall_with_rate_limit(
+            litellm.acompletion,
             model="openai/gpt-4o-mini-search-preview",
             messages=[
                 {
@@ -375,18 +471,16 @@ async def chat(ctx, *, message: str):
     history = user_history[ctx.author.id]
 
     try:
-        async with ctx.typing():
-            response = client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant specializing in answering questions."},
-                    *history
-                ],
-                max_tokens=1024
-            )
-
-        await ctx.send(response.choices[0].message.content)
-        history.append({"role": "assistant", "content": response.choices[0].message.content})
+        response = await send_streaming_message(ctx, astream_chat_completion(
+            aclient,
+            "gpt-4.1-mini",
+            [
+                {"role": "system", "content": "You are a helpful AI assistant specializing in answering questions."},
+                *history
+            ],
+            max_tokens=1024
+        ))
+        history.append({"role": "assistant", "content": response})
 
     except Exception as e:
         await ctx.send(f"An error occurred: {str(e)}")
@@ -441,9 +535,7 @@ async def clear(ctx):
 async def websumm(ctx, url: str, model: str = "gpt-4.1-mini"):
     try:
         async with ctx.typing():
-            summary = await summarize_website(client, url, model=model)
-
-            await ctx.send(summary)
+            await send_streaming_message(ctx, stream_summarize_website(aclient, url, model=model))
 
     except Exception as e:
         await ctx.send(f"An error occurred while summarizing the website: {str(e)}")
@@ -455,8 +547,7 @@ async def openreview(ctx, url: str, model: str = "gpt-4.1"):
     try:
         # mark emoji
         await ctx.message.add_reaction("👀")
-        review = await get_openreview_summarization(client, url, model)
-        await ctx.send(review)
+        await send_streaming_message(ctx, stream_openreview_summarization(aclient, url, model))
         # remove mark emoji
         await ctx.message.remove_reaction("👀", bot.user)
 
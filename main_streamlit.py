@@ -5,6 +5,7 @@ import streamlit as st
 import tempfile
 from pptgen import create_presentation_from_report
 import litellm
+from ai_scientist.rate_limit import call_with_rate_limit
 from traceback import print_exc
 load_dotenv()
 
@@ -81,9 +82,11 @@ def process_presentation(prompt, files):
         print_exc()
         return
     
-def process_web_search(prompt):
+def stream_web_search(prompt):
+    # 검색 결과를 생성되는 대로 yield (st.write_stream용)
     prompt = f"Search the web and create a report for information related to:\n\n{prompt}"
-    output = litellm.completion(
+    output = call_with_rate_limit(
+        litellm.completion,
         # model="openrouter/perplexity/sonar-deep-research",
         # model="openrouter/perplexity/sonar-pro",
         model=os.environ.get("LLM_MODEL_WEB", "openrouter/perplexity/sonar-pro"),
@@ -91,16 +94,22 @@ def process_web_search(prompt):
             {"role": "user", "content": prompt}
         ],
         max_tokens=65536,
+        stream=True,
+        stream_options={"include_usage": True},
     )
-    result = output.choices[0].message.content
-    
-    if hasattr(output.choices[0].message, "annotations"):
-        for i, annotation in enumerate(output.choices[0].message.annotations):
-            if annotation['type'] == 'url_citation':
-                cite = annotation['url_citation']
-                result += f"\n\n[{i + 1}]: {cite['url']}"
+    annotations = []
+    for chunk in output:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            yield delta.content
+        annotations.extend(getattr(delta, "annotations", None) or [])
 
-    return result
+    for i, annotation in enumerate(annotations):
+        if annotation['type'] == 'url_citation':
+            cite = annotation['url_citation']
+            yield f"\n\n[{i + 1}]: {cite['url']}"
 
 if st.button("Generate PPT"):
     
@@ -120,12 +129,9 @@ if st.button("Generate PPT"):
                 file_paths.append(temp_file_path)
 
             if use_web_search:
-                with st.spinner("Performing web search..."):
-                    web_search_results = process_web_search(prompt)
-                    prompt += f"\n\n---\n\nWeb search results:\n{web_search_results}"
-                
-                with st.expander("Web Search Results"):
-                    st.markdown(web_search_results)
+                with st.expander("Web Search Results", expanded=True):
+                    web_search_results = st.write_stream(stream_web_search(prompt))
+                prompt += f"\n\n---\n\nWeb search results:\n{web_search_results}"
 
             with st.spinner("Generating PPT..."):
                 process_presentation(prompt, file_paths)
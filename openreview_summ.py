@@ -5,6 +5,8 @@ from selenium.webdriver.chrome.options import Options
 import time
 from bs4 import BeautifulSoup
 from markdownify import markdownify as md
+from ai_scientist.llm import astream_chat_completion
+from ai_scientist.rate_limit import call_with_rate_limit
 
 
 
@@ -52,13 +54,17 @@ SUMMARY_PROMPT="""다음은 OpenReview에서 가져온 논문 리뷰와 저자 
 # 4. 저자들의 핵심 반박 또는 설명
 # 5. 저자들의 반박이 효과적이었는지, 또는 추가 개선이 필요한지 여부
 
+def build_openreview_messages(text):
+    return [
+        {"role": "system", "content": "당신은 웹 사이트를 분석하고 유용한 정보를 사용자에게 전달하는 한국어 요약 AI입니다."},
+        {"role": "user", "content": SUMMARY_PROMPT.format(text=text)}
+    ]
+
 def summarize_openreview(client, text, model="gpt-4o"):
-    response = client.chat.completions.create(
+    response = call_with_rate_limit(
+        client.chat.completions.create,
         model=model,
-        messages=[
-            {"role": "system", "content": "당신은 웹 사이트를 분석하고 유용한 정보를 사용자에게 전달하는 한국어 요약 AI입니다."},
-            {"role": "user", "content": SUMMARY_PROMPT.format(text=text)}
-        ],
+        messages=build_openreview_messages(text),
         max_tokens=2048
     )
     return response.choices[0].message.content.strip()
@@ -68,6 +74,12 @@ async def get_openreview_summarization(client, url: str, model: str):
     summ = summarize_openreview(client, review, model)
     return summ
 
+async def stream_openreview_summarization(client, url: str, model: str):
+    # client는 AsyncOpenAI 클라이언트, selenium 크롤링은 별도 스레드에서 실행
+    review = await asyncio.to_thread(get_openreview, url)
+    async for delta in astream_chat_completion(client, model, build_openreview_messages(review), max_tokens=2048):
+        yield delta
+
 
 
 if __name__ == "__main__":
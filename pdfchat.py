@@ -1,4 +1,4 @@
-import requests
+import asyncio
 import os
 import hashlib
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -8,26 +8,11 @@ from langchain.chains import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferMemory
 from langchain_community.llms import OpenAI
 import openai
+from ai_reviewer.convert import aparse_pdf
+from ai_scientist.downloader import download_pdf
 
 
-# Step 1: Download PDF from arXiv URL
-def download_pdf(url):
-    if url.startswith("https://arxiv.org/abs/"):
-        url = url.replace("abs", "pdf")
-
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    pdf_path = f"pdfs/{url_hash}.pdf"
-
-    if os.path.exists(pdf_path):
-        print("PDF already downloaded.")
-        return pdf_path
-    
-    os.makedirs("pdfs", exist_ok=True)
-
-    response = requests.get(url)
-    with open(pdf_path, "wb") as f:
-        f.write(response.content)
-    return pdf_path
+# Step 1: Download PDF from arXiv URL (ai_scientist.downloader.download_pdf)
 
 # Step 2: Extract content from PDF
 # def extract_text_from_pdf(pdf_path):
@@ -39,14 +24,8 @@ def download_pdf(url):
 #     return text
 
 async def extract_text_from_pdf(pdf_path):
-    # curl -X POST -F "file=@2401.01854.pdf" http://localhost:8000/parse_document/pdf 
-    url = "http://localhost:8000/parse_document/pdf"
-    files = {"file": open(pdf_path, "rb")}
-    response = requests.post(url, files=files, timeout=240)
-    text = response.json()["text"]
-    with open(f"{pdf_path}.txt", "w") as f:
-        f.write(text)
-    return text
+    # omniparse 결과는 ai_reviewer와 같은 문서 저장소(PDF SHA-256 기준)를 공유
+    return (await aparse_pdf(pdf_path))["text"]
 
 def get_vector_store(url, pdf_text, use_cache = True):
     # URL을 해시하여 고유한 파일 이름 생성
@@ -94,7 +73,7 @@ def chatbot():
     arxiv_url = input("Please enter the arXiv PDF URL: ")
     
     pdf_path = download_pdf(arxiv_url)
-    pdf_text = extract_text_from_pdf(pdf_path)
+    pdf_text = asyncio.run(extract_text_from_pdf(pdf_path))
     
     vector_store = get_vector_store(arxiv_url, pdf_text)
     conversation_chain = setup_conversational_chain(vector_store)
@@ -10,6 +10,8 @@ from pptx.enum.shapes import MSO_SHAPE_TYPE
 from pptx.enum.dml import MSO_THEME_COLOR
 import os
 import asyncio
+from ai_scientist.rate_limit import acall_with_rate_limit
+from ai_scientist.instrumentation import track_pipeline
 
 
 class SlideRequest(BaseModel):
@@ -86,7 +88,8 @@ Here’s a concise English guideline to produce well-structured, audience-friend
 """
 
 async def generate_presentation(prompt: str, model: str = "openai/gpt-4o-search-preview") -> PresentationRequest:
-    response = await litellm.acompletion(
+    response = await acall_with_rate_limit(
+        litellm.acompletion,
         model=model,
         messages=[
             {
@@ -102,7 +105,8 @@ async def generate_presentation(prompt: str, model: str = "openai/gpt-4o-search-
     )
     print("Response from model:\n", response.choices[0].message.content)
     
-    response = await litellm.acompletion(
+    response = await acall_with_rate_limit(
+        litellm.acompletion,
         model="gpt-4.1-mini",
         messages=[
             {
@@ -229,7 +233,8 @@ async def generate_presentation_structure(user_requirements: str, report: str, m
     SYSTEM_PROMPT = """
 You are a helpful assistant that generates structured outlines for PowerPoint presentations based on user reports. Each outline consists of a title, description, total number of slides, and sections with titles, descriptions, and slide counts.
 """
-    response = await litellm.acompletion(
+    response = await acall_with_rate_limit(
+        litellm.acompletion,
         model=model,
         messages=[
             {
@@ -256,7 +261,8 @@ Guidelines for generating slides:
 - The content should be clear and concise, ideally 100-150 words per slide.
 - Use bullet points for clarity, with 3-5 bullets per slide.
 """
-    response = await litellm.acompletion(
+    response = await acall_with_rate_limit(
+        litellm.acompletion,
         model=model,
         messages=[
             {
@@ -274,6 +280,7 @@ Guidelines for generating slides:
     presentation = PresentationRequest(**json.loads(response.choices[0].message.content))
     return presentation.slides
 
+@track_pipeline("pptgen")
 async def create_presentation_from_report(user_requirements: str, report: str, model: str, filename: str = None) -> str:
     structure = await generate_presentation_structure(user_requirements, report, model=model)
     
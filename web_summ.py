@@ -11,6 +11,8 @@ from crawl4ai.extraction_strategy import JsonCssExtractionStrategy, LLMExtractio
 import json
 import time
 from pydantic import BaseModel, Field
+from ai_scientist.llm import astream_chat_completion
+from ai_scientist.rate_limit import call_with_rate_limit
 
 nest_asyncio.apply()
 
@@ -69,13 +71,17 @@ SUMMARY_PROMPT="""다음 웹사이트의 HTML 텍스트를 분석하고 아래 
 4. 관련 연구 분야 제안 (2-3개)
 {text}
 """.strip()
+def build_summary_messages(text):
+    return [
+        {"role": "system", "content": "당신은 웹 사이트를 분석하고 유용한 정보를 사용자에게 전달하는 한국어 요약 AI입니다."},
+        {"role": "user", "content": SUMMARY_PROMPT.format(text=text)}
+    ]
+
 def summarize_with_openai(client, text, model="gpt-4o-mini"):
-    response = client.chat.completions.create(
+    response = call_with_rate_limit(
+        client.chat.completions.create,
         model=model,
-        messages=[
-            {"role": "system", "content": "당신은 웹 사이트를 분석하고 유용한 정보를 사용자에게 전달하는 한국어 요약 AI입니다."},
-            {"role": "user", "content": SUMMARY_PROMPT.format(text=text)}
-        ],
+        messages=build_summary_messages(text),
         max_tokens=1024
     )
     return response.choices[0].message.content.strip()
@@ -88,6 +94,12 @@ async def summarize_website(client, url, model="gpt-4o-mini"):
     summary = summarize_with_openai(client, main_content, model)
     return summary
 
+async def stream_summarize_website(client, url, model="gpt-4o-mini"):
+    # client는 AsyncOpenAI 클라이언트, 요약 결과를 토큰 단위로 yield
+    main_content = await load_webpage_crawl4ai(url)
+    async for delta in astream_chat_completion(client, model, build_summary_messages(main_content), max_tokens=1024):
+        yield delta
+
 # 사용 예제
 if __name__ == "__main__":
     client = openai.OpenAI()